@@ -0,0 +1,87 @@
+"""
+Symptom-Cluster Scoring Benchmark
+Builds synthetic cluster catalogs of growing size and times one request's
+scoring with the compiled ClusterIndex against the legacy nested-loop scan.
+Fails if the compiled index's median exceeds the budget at the largest size.
+
+Usage: python bench_clusters.py [sizes...]   (default: 10 100 1000 10000)
+Env:   CLUSTER_SCORE_BUDGET_MS (default 5)
+"""
+
+import os
+import sys
+import time
+import random
+import statistics
+
+from cluster_index import ClusterIndex
+
+CLUSTER_SCORE_BUDGET_MS = float(os.getenv("CLUSTER_SCORE_BUDGET_MS", "5"))
+
+BODY_PARTS = ["head", "chest", "abdominal", "back", "neck", "joint", "arm", "leg", "eye", "ear", "throat", "jaw"]
+SIGNS = ["pain", "swelling", "numbness", "stiffness", "redness", "itching", "weakness", "tingling", "bleeding", "cramps"]
+GENERAL = ["fever", "nausea", "vomiting", "fatigue", "dizziness", "cough", "sweating", "chills", "rash", "headache"]
+
+REQUEST = ["severe chest pain", "sweating", "nausea since morning", "pain", "dizziness", "arm numbness"]
+
+
+def synthetic_catalog(size: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    vocabulary = GENERAL + [f"{part} {sign}" for part in BODY_PARTS for sign in SIGNS]
+    vocabulary += [f"rare sign {i}" for i in range(size // 2)]
+    return {
+        f"condition_{i}": {
+            "core_symptoms": rng.sample(vocabulary, 4),
+            "related_symptoms": rng.sample(vocabulary, 4),
+            "severity": rng.choice(["low", "moderate", "high", "critical"])
+        }
+        for i in range(size)
+    }
+
+
+def legacy_match(clusters: dict, symptoms: list) -> list:
+    """The original O(symptoms x clusters x terms) scan, for comparison"""
+    normalized = [s.lower().strip() for s in symptoms]
+    matches = []
+    for name, data in clusters.items():
+        core = sum(1 for s in normalized if any(c in s or s in c for c in data["core_symptoms"]))
+        related = sum(1 for s in normalized if any(r in s or s in r for r in data["related_symptoms"]))
+        if core:
+            matches.append((name, core, related, round(core / len(data["core_symptoms"]) * 100, 1)))
+    matches.sort(key=lambda m: m[3], reverse=True)
+    return matches
+
+
+def median_ms(fn, runs: int) -> float:
+    fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [10, 100, 1000, 10000]
+
+    print("=" * 72)
+    print(f"{'clusters':>10} {'terms':>8} {'build ms':>10} {'index ms':>10} {'legacy ms':>10} {'matches':>8}")
+    index_ms = None
+    for size in sizes:
+        catalog = synthetic_catalog(size)
+
+        start = time.perf_counter()
+        index = ClusterIndex(catalog)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        index_ms = median_ms(lambda: index.match(REQUEST), runs=50)
+        legacy_ms = median_ms(lambda: legacy_match(catalog, REQUEST), runs=5 if size >= 10000 else 20)
+        _, total = index.match(REQUEST)
+        print(f"{size:>10} {len(index.terms):>8} {build_ms:>10.1f} {index_ms:>10.3f} {legacy_ms:>10.3f} {total:>8}")
+
+    print(f"Budget: {CLUSTER_SCORE_BUDGET_MS:.3f}ms per request at {sizes[-1]} clusters")
+    if index_ms > CLUSTER_SCORE_BUDGET_MS:
+        print("❌ Cluster scoring exceeded budget")
+        sys.exit(1)
+    print("✅ Cluster scoring within budget")
@@ -0,0 +1,111 @@
+"""
+Prescription Image Normalization Benchmark
+Builds synthetic prescription photos (text on a page, EXIF-rotated phone JPEGs
+and a PNG scan) and compares, per image:
+- OCR prep CPU time: legacy (full-resolution decode + contrast/sharpen) vs
+  normalized (draft decode, orient, grayscale, downsample, then the same filters)
+- vision payload: base64 of the raw upload vs of the normalized JPEG
+Tesseract itself isn't timed (it may not be installed); its run time also
+scales with the pixel count, which is reported.
+Fails if the normalized prep of the largest image exceeds the budget.
+
+Usage: python bench_image_normalize.py [runs]   (default: 3)
+Env:   IMAGE_PREP_BUDGET_MS (default 500)
+"""
+
+import io
+import os
+import sys
+import time
+import base64
+import random
+import statistics
+
+from PIL import Image, ImageDraw, ImageFont
+
+from image_normalize import normalize_for_vision, normalize_image
+from ocr_pool import preprocess_image
+
+IMAGE_PREP_BUDGET_MS = float(os.getenv("IMAGE_PREP_BUDGET_MS", "500"))
+
+# (label, width, height, format, EXIF orientation)
+CASES = [
+    ("12MP phone JPEG (rotated)", 4032, 3024, "JPEG", 6),
+    ("8MP phone JPEG", 3264, 2448, "JPEG", 1),
+    ("3MP phone JPEG", 2048, 1536, "JPEG", 1),
+    ("A4 300dpi PNG scan", 2480, 3508, "PNG", None),
+]
+
+WORDS = ["Tab", "Paracetamol", "500mg", "TID", "x5", "days", "Cap", "Amoxicillin", "BID", "after", "food",
+         "Dr.", "Sharma", "MBBS", "Reg", "No", "Syrup", "10ml", "HS", "Review", "in", "1", "week"]
+
+
+def synthetic_prescription(width: int, height: int, fmt: str, orientation, seed: int = 3) -> bytes:
+    """A page of dark text lines on an off-white, slightly noisy background"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (236, 232, 222))
+    draw = ImageDraw.Draw(image)
+    line_height = max(12, height // 60)
+    font = ImageFont.load_default(size=line_height * 0.7)
+    for y in range(line_height * 2, height - line_height * 2, line_height * 2):
+        text = " ".join(rng.choice(WORDS) for _ in range(12))
+        draw.text((width // 12, y), text, fill=(30, 30, 50), font=font)
+    # Sensor noise keeps the JPEG size realistic
+    noise = Image.effect_noise((width, height), 12).convert("RGB")
+    image = Image.blend(image, noise, 0.08)
+
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        image.save(buffer, "JPEG", quality=92, exif=exif.tobytes())
+    else:
+        image.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def legacy_prep(image_bytes: bytes):
+    """The pre-normalization OCR path: full-resolution decode, then filters"""
+    return preprocess_image(Image.open(io.BytesIO(image_bytes)))
+
+
+def normalized_prep(image_bytes: bytes):
+    return preprocess_image(normalize_image(image_bytes))
+
+
+def median_cpu_ms(fn, runs: int):
+    result = fn()
+    timings = []
+    for _ in range(runs):
+        start = time.process_time()
+        fn()
+        timings.append((time.process_time() - start) * 1000)
+    return statistics.median(timings), result
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    print("=" * 100)
+    print(f"{'image':<28} {'upload KB':>10} {'prep ms':>9} {'norm ms':>9} {'OCR px':>17} "
+          f"{'vision b64 KB':>14} {'norm b64 KB':>12}")
+    largest_ms = None
+    for label, width, height, fmt, orientation in CASES:
+        image_bytes = synthetic_prescription(width, height, fmt, orientation)
+
+        legacy_ms, legacy_image = median_cpu_ms(lambda: legacy_prep(image_bytes), runs)
+        normalized_ms, normalized_image = median_cpu_ms(lambda: normalized_prep(image_bytes), runs)
+        vision_bytes = normalize_for_vision(image_bytes)
+
+        pixels = f"{legacy_image.width * legacy_image.height / 1e6:.1f}->{normalized_image.width * normalized_image.height / 1e6:.1f}M"
+        print(f"{label:<28} {len(image_bytes) / 1024:>10.0f} {legacy_ms:>9.1f} {normalized_ms:>9.1f} {pixels:>17} "
+              f"{len(base64.b64encode(image_bytes)) / 1024:>14.0f} {len(base64.b64encode(vision_bytes)) / 1024:>12.0f}")
+        if largest_ms is None:
+            largest_ms = normalized_ms
+
+    print(f"Budget: {IMAGE_PREP_BUDGET_MS:.0f}ms CPU to prepare the {CASES[0][0]}")
+    if largest_ms > IMAGE_PREP_BUDGET_MS:
+        print("❌ Image normalization exceeded budget")
+        sys.exit(1)
+    print("✅ Image normalization within budget")
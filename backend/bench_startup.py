@@ -0,0 +1,55 @@
+"""
+Startup-Time Benchmark
+Measures how long `import main` takes in a fresh interpreter (what uvicorn
+pays before it can bind) and fails if the median exceeds the budget.
+
+Usage: python bench_startup.py [runs]
+Env:   STARTUP_BUDGET_SECONDS (default 1.0)
+"""
+
+import os
+import sys
+import time
+import statistics
+import subprocess
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.0"))
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_once() -> float:
+    env = dict(os.environ)
+    env.setdefault("GROQ_API_KEY", "bench-key")
+    # Measure the import only; don't start the background warm-up
+    env["WARMUP_ON_STARTUP"] = "0"
+    env["RULES_RELOAD_INTERVAL"] = "0"
+
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "import main"],
+        cwd=current_dir,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    # First run primes the bytecode cache and is not counted
+    measure_once()
+    timings = [measure_once() for _ in range(runs)]
+
+    median = statistics.median(timings)
+    print("=" * 60)
+    print(f"import main: median {median:.3f}s, min {min(timings):.3f}s, max {max(timings):.3f}s over {runs} runs")
+    print(f"Budget: {STARTUP_BUDGET_SECONDS:.3f}s")
+
+    if median > STARTUP_BUDGET_SECONDS:
+        print("❌ Startup exceeded budget")
+        sys.exit(1)
+    print("✅ Startup within budget")
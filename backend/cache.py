@@ -0,0 +1,77 @@
+"""
+TTL + LRU Cache
+Small in-process cache shared by the triage and retrieval layers.
+Entries expire after `ttl` seconds and the least recently used entry is
+evicted once `maxsize` entries (or, if set, `max_bytes` of estimated
+payload) is exceeded.
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(value) -> int:
+    """Approximate payload size in bytes (JSON-encoded length)"""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+
+class TTLCache:
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, max_bytes: int = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._data = OrderedDict()  # key -> (expires_at, value, size)
+        self._lock = threading.Lock()
+        # Bumped on every mutation so derived indexes know when to rebuild
+        self.version = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value, size = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.current_bytes -= size
+                self.version += 1
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = estimate_size(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[2]
+            self._data[key] = (time.monotonic() + self.ttl, value, size)
+            self.current_bytes += size
+            while len(self._data) > self.maxsize or (self.max_bytes and self.current_bytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self.current_bytes -= evicted[2]
+            self.version += 1
+
+    def items(self):
+        """Snapshot of live (key, value) pairs, oldest first"""
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (expires_at, v, _) in self._data.items() if expires_at >= now]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+            self.version += 1
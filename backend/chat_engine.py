@@ -1,75 +1,146 @@
-import os
-from groq import Groq
-from dotenv import load_dotenv
+import time
 
-# Load environment variables
-current_dir = os.path.dirname(os.path.abspath(__file__))
-env_path = os.path.join(current_dir, ".env")
-load_dotenv(env_path)
+import circuit_breaker
+import metrics
+from llm_client import GROQ_API_KEY, chat_completion, stream_chat_completion
+from llm_scheduler import PRIORITY_ENRICHMENT
+from history_manager import build_history
+from model_router import choose_chat_model, record_latency
+from rule_engine import get_engine
 
-# Initialize Groq client
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+# Large-model default; choose_model() sends simple messages to the 8B model
+CHAT_MODEL = "llama-3.3-70b-versatile"
 
-def get_medical_response(message: str, user_id: str, chat_history: list = None) -> str:
+FALLBACK_REPLY = "I apologize, but I'm having trouble connecting to my medical knowledge base right now. Please try again in a moment."
+
+
+def choose_model(message: str) -> str:
+    """
+    Route a chat turn: emergency-sounding messages (rule/keyword match) and
+    long messages get the large model, everything else the 8B model
+    """
+    return choose_chat_model(message, rule_match=bool(get_engine().current().matcher.match(message)))
+
+
+async def build_chat_messages(message: str, user_id: str, chat_history: list = None, model: str = CHAT_MODEL) -> list:
+    """
+    Assemble the system prompt, budgeted history and current message
+    """
+    # Normalize chat_history if it was passed as keyword arg or regular arg
+    history = chat_history if chat_history else []
+    # Prepare messages for the LLM
+    messages = [
+        {
+            "role": "system",
+            "content": """You are Dr. AI, a helpful and empathetic virtual medical assistant. 
+            Your goal is to provide preliminary medical advice, explanations, and comfort.
+            ALWAYS clarify that you are an AI and not a real doctor.
+            If symptoms seem severe (chest pain, difficulty breathing, severe bleeding), advise immediate medical attention.
+            Keep responses concise, clear, and reassuring.
+            Use simple language avoiding complex jargon where possible."""
+        }
+    ]
+    
+    # Add history, windowed to the model's token budget
+    if history:
+        history_messages, stats = await build_history(user_id, history, model)
+        messages.extend(history_messages)
+        print(f"🧾 [Chat Engine] History: {stats['prompt_history_tokens']}/{stats['history_tokens']} tokens sent, {stats['tokens_saved']} saved")
+    
+    # Add current message
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+async def get_medical_response(message: str, user_id: str, chat_history: list = None) -> str:
     """
     Generate a medical response using Groq LLM.
     Args:
         message: The user's current message
-        user_id: ID of the user/session (for tracking context if needed)
+        user_id: ID of the user/session (keys the rolling history summary)
         chat_history: List of previous chat messages
     """
-    if not client:
+    if not GROQ_API_KEY:
         return "Error: AI service is not configured (missing API key)."
 
     try:
-        # Normalize chat_history if it was passed as keyword arg or regular arg
-        history = chat_history if chat_history else []
-        # Prepare messages for the LLM
-        messages = [
-            {
-                "role": "system",
-                "content": """You are Dr. AI, a helpful and empathetic virtual medical assistant. 
-                Your goal is to provide preliminary medical advice, explanations, and comfort.
-                ALWAYS clarify that you are an AI and not a real doctor.
-                If symptoms seem severe (chest pain, difficulty breathing, severe bleeding), advise immediate medical attention.
-                Keep responses concise, clear, and reassuring.
-                Use simple language avoiding complex jargon where possible."""
-            }
-        ]
-        
-        # Add history if provided
-        if history:
-            for msg in history:
-                role = "user" if msg.get("sender") == "user" else "assistant"
-                messages.append({"role": role, "content": msg.get("message", "")})
-        
-        # Add current message
-        messages.append({"role": "user", "content": message})
+        model = choose_model(message)
+        if circuit_breaker.is_open(model):
+            # Upstream failing: answer now instead of waiting on a timeout
+            metrics.incr("chat.circuit_fallbacks")
+            return FALLBACK_REPLY
+        messages = await build_chat_messages(message, user_id, chat_history, model)
 
         # Call Groq API
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+        started = time.perf_counter()
+        completion = await chat_completion(
+            model=model,
             messages=messages,
             temperature=0.7,
             max_tokens=500
         )
+        record_latency("chat", model, time.perf_counter() - started)
 
         return completion.choices[0].message.content
 
     except Exception as e:
         print(f"❌ [Chat Engine] Error: {e}")
-        return "I apologize, but I'm having trouble connecting to my medical knowledge base right now. Please try again in a moment."
+        return FALLBACK_REPLY
+
+
+async def stream_medical_response(message: str, user_id: str, chat_history: list = None):
+    """
+    Streaming variant of get_medical_response.
+    Yields text deltas as Groq produces them and records time-to-first-token.
+    A failure before the first token yields the fallback reply; after it, the
+    error is raised so the caller can flag the partial reply.
+    """
+    if not GROQ_API_KEY:
+        yield "Error: AI service is not configured (missing API key)."
+        return
+
+    started = time.perf_counter()
+    first_token = True
+    model = CHAT_MODEL
+    try:
+        model = choose_model(message)
+        if circuit_breaker.is_open(model):
+            metrics.incr("chat.circuit_fallbacks")
+            yield FALLBACK_REPLY
+            return
+        messages = await build_chat_messages(message, user_id, chat_history, model)
+
+        async for delta in stream_chat_completion(
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=500
+        ):
+            if first_token:
+                first_token = False
+                metrics.observe("chat.stream.ttft_seconds", time.perf_counter() - started)
+            yield delta
+
+    except Exception as e:
+        print(f"❌ [Chat Engine] Stream error: {e}")
+        if not first_token:
+            metrics.incr("chat.stream.interrupted")
+            raise
+        yield FALLBACK_REPLY
+    finally:
+        metrics.observe("chat.stream.total_seconds", time.perf_counter() - started)
+        record_latency("chat", model, time.perf_counter() - started)
 
-def generate_summary(text: str) -> str:
+async def generate_summary(text: str) -> str:
     """
     Generate a concise summary of the medical interaction.
     """
-    if not client:
+    if not GROQ_API_KEY:
         return "Summary unavailable (AI config error)."
         
     try:
-        completion = client.chat.completions.create(
+        completion = await chat_completion(
+            priority=PRIORITY_ENRICHMENT,
             model="llama-3.1-8b-instant",
             messages=[
                 {"role": "system", "content": "Summarize the following medical symptom description in 2-3 key phrases."},
@@ -0,0 +1,331 @@
+"""
+Shared Circuit Breaker
+One breaker per Groq model, shared by every uvicorn worker through a small
+SQLite file so a brownout seen by one worker protects all of them:
+- closed: calls go through; CIRCUIT_FAILURE_THRESHOLD consecutive upstream
+  failures (5xx, timeouts, connection errors) open the circuit
+- open: calls are refused with CircuitOpen for CIRCUIT_OPEN_SECONDS, so
+  callers drop straight to their degraded path instead of waiting on timeouts
+- half-open: after the cool-down one caller (in any worker) probes the model;
+  success closes the circuit, failure re-opens it
+Rate limits (429) are not failures: the scheduler already paces those, and
+timeouts cut short by the caller's own request deadline aren't either.
+Calls are admitted from an in-memory copy of the shared state; a daemon
+thread writes outcomes to the file and re-reads it every CIRCUIT_SYNC_SECONDS
+(at once when a failure is recorded), so the event loop never waits on SQLite
+except to claim a half-open probe.
+If the state file can't be opened the breaker stays out of the way (always closed).
+"""
+
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+
+import metrics
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+CIRCUIT_BREAKER_PATH = os.getenv("CIRCUIT_BREAKER_PATH", os.path.join(current_dir, "circuit_state.sqlite3"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+# A half-open probe that hasn't reported back within this lease is presumed lost
+CIRCUIT_PROBE_SECONDS = float(os.getenv("CIRCUIT_PROBE_SECONDS", "15"))
+# How stale this worker's copy of the shared state may get
+CIRCUIT_SYNC_SECONDS = float(os.getenv("CIRCUIT_SYNC_SECONDS", "1"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_HEALTHY = (CLOSED, 0, 0.0, 0.0)  # (state, failures, opened_at, probe_until)
+
+
+class CircuitOpen(RuntimeError):
+    """Raised instead of calling a model whose circuit is open"""
+
+
+class CircuitBreaker:
+
+    def __init__(self, path: str = CIRCUIT_BREAKER_PATH, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 open_seconds: float = CIRCUIT_OPEN_SECONDS, probe_seconds: float = CIRCUIT_PROBE_SECONDS,
+                 sync_seconds: float = CIRCUIT_SYNC_SECONDS):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.probe_seconds = probe_seconds
+        self.sync_seconds = sync_seconds
+        self.enabled = True
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._rows = {}       # model -> shared row as last synced, plus outcomes not yet written
+        self._pending = []    # (model, ok) outcomes waiting for the sync thread
+        self._wake = threading.Event()
+        self._synced = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, name="circuit-sync", daemon=True)
+        self._syncer.start()
+
+    def _conn(self):
+        # One connection per thread; WAL keeps the state reads off the write lock
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row(self, conn, model: str):
+        row = conn.execute(
+            "SELECT state, failures, opened_at, probe_until FROM circuits WHERE model = ?", (model,)
+        ).fetchone()
+        return row or _HEALTHY
+
+    def _write(self, conn, model: str, row):
+        conn.execute(
+            "INSERT OR REPLACE INTO circuits (model, state, failures, opened_at, probe_until) VALUES (?, ?, ?, ?, ?)",
+            (model, *row)
+        )
+
+    def _blocked(self, row, now: float) -> bool:
+        state, _, opened_at, probe_until = row
+        if state == OPEN:
+            return now < opened_at + self.open_seconds
+        if state == HALF_OPEN:
+            return now < probe_until
+        return False
+
+    def _apply(self, row, ok: bool, now: float):
+        """Row after one call outcome"""
+        state, failures, opened_at, probe_until = row
+        if ok:
+            return _HEALTHY
+        failures += 1
+        if state == HALF_OPEN or (state == CLOSED and failures >= self.failure_threshold):
+            return (OPEN, failures, now, 0.0)
+        return (state, failures, opened_at, probe_until)
+
+    # Sync thread
+
+    def _sync_loop(self):
+        try:
+            self._conn().execute(
+                "CREATE TABLE IF NOT EXISTS circuits ("
+                "model TEXT PRIMARY KEY, state TEXT NOT NULL, failures INTEGER NOT NULL, "
+                "opened_at REAL NOT NULL, probe_until REAL NOT NULL)"
+            )
+        except sqlite3.Error as e:
+            print(f"⚠️ [Circuit Breaker] Disabled, could not open {self.path}: {e}")
+            self.enabled = False
+            self._synced.set()
+            return
+
+        while True:
+            try:
+                self._sync()
+            except sqlite3.Error as e:
+                print(f"⚠️ [Circuit Breaker] State sync failed: {e}")
+            self._synced.set()
+            self._wake.wait(self.sync_seconds)
+            self._wake.clear()
+
+    def _sync(self):
+        """Write pending outcomes to the shared file, then reload every model's row"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        conn = self._conn()
+        transitions = []
+        if pending:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                rows = {}
+                for model, ok in pending:
+                    if model not in rows:
+                        rows[model] = self._row(conn, model)
+                    before = rows[model]
+                    rows[model] = self._apply(before, ok, now)
+                    if rows[model][0] != before[0]:
+                        transitions.append((model, rows[model]))
+                for model, row in rows.items():
+                    self._write(conn, model, row)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+
+        shared = {
+            model: tuple(row) for model, *row in conn.execute(
+                "SELECT model, state, failures, opened_at, probe_until FROM circuits"
+            )
+        }
+        with self._lock:
+            # Outcomes recorded while this sync ran stay visible until the next one
+            now = time.time()
+            for model, ok in self._pending:
+                shared[model] = self._apply(shared.get(model, _HEALTHY), ok, now)
+            self._rows = shared
+
+        for model, row in transitions:
+            if row[0] == OPEN:
+                print(f"🔴 [Circuit Breaker] {model} circuit opened after {row[1]} failure(s), "
+                      f"degrading for {self.open_seconds:.0f}s")
+                metrics.incr(f"circuit.{model}.opened")
+            elif row[0] == CLOSED:
+                print(f"🟢 [Circuit Breaker] {model} recovered, circuit closed")
+                metrics.incr(f"circuit.{model}.closed")
+
+    def wait_synced(self, timeout: float = None) -> bool:
+        """Block until the first sync has loaded the shared state (tests, tools)"""
+        return self._synced.wait(timeout)
+
+    # Event loop side
+
+    def _cached(self, model: str):
+        return self._rows.get(model, _HEALTHY)
+
+    def is_open(self, model: str) -> bool:
+        """True if a call to `model` would be refused right now (no I/O)"""
+        return self.enabled and self._blocked(self._cached(model), time.time())
+
+    def _claim_probe(self, model: str) -> bool:
+        # Claim the probe under the write lock so only one worker gets it
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._row(conn, model)
+            now = time.time()
+            probe = row[0] != CLOSED and not self._blocked(row, now)
+            if probe:
+                row = (HALF_OPEN, row[1], row[2], now + self.probe_seconds)
+                self._write(conn, model, row)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._rows = {**self._rows, model: row}
+        return probe
+
+    async def acquire(self, model: str):
+        """
+        Admit a call to `model` or raise CircuitOpen. Once an open circuit has
+        cooled down, exactly one caller across all workers is admitted as the probe.
+        """
+        if not self.enabled:
+            return
+        row = self._cached(model)
+        if row[0] == CLOSED:
+            return
+        probe = False
+        if not self._blocked(row, time.time()):
+            try:
+                # Only reached once per cool-down; the write lock is awaited off the loop
+                probe = await asyncio.to_thread(self._claim_probe, model)
+            except sqlite3.Error as e:
+                print(f"⚠️ [Circuit Breaker] Probe claim failed, allowing call: {e}")
+                return
+            if self._cached(model)[0] == CLOSED:
+                return
+
+        if probe:
+            print(f"🟡 [Circuit Breaker] {model} half-open, sending probe")
+            metrics.incr(f"circuit.{model}.probes")
+            return
+        metrics.incr("circuit.rejected")
+        metrics.incr(f"circuit.{model}.rejected")
+        raise CircuitOpen(f"{model} circuit is open (upstream failing)")
+
+    def _record(self, model: str, ok: bool):
+        if not self.enabled:
+            return
+        with self._lock:
+            row = self._rows.get(model, _HEALTHY)
+            # Hot path: nothing to write while the circuit is healthy
+            if ok and row == _HEALTHY:
+                return
+            self._pending.append((model, ok))
+            # Act on the outcome in this worker now; the sync thread shares it
+            self._rows = {**self._rows, model: self._apply(row, ok, time.time())}
+        if not ok:
+            self._wake.set()
+
+    def record_success(self, model: str):
+        self._record(model, True)
+
+    def record_failure(self, model: str):
+        self._record(model, False)
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {}
+        now = time.time()
+        stats = {}
+        for model, row in self._rows.items():
+            state, failures, opened_at, _ = row
+            # An open circuit past its cool-down is waiting for its probe
+            if state != CLOSED and not self._blocked(row, now):
+                state = HALF_OPEN
+            stats[model] = {
+                "state": state,
+                "consecutive_failures": failures,
+                "retry_in": round(max(0.0, opened_at + self.open_seconds - now), 1) if state == OPEN else 0.0
+            }
+        return stats
+
+
+def counts_as_failure(error, deadline_limited: bool = False) -> bool:
+    """
+    Upstream brownout errors (5xx, timeouts, connection failures).
+    deadline_limited: the call's timeout was shortened to the request's
+    remaining time, so a timeout says nothing about the upstream.
+    """
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status >= 500
+    name = type(error).__name__
+    if name == "APITimeoutError":
+        return not deadline_limited
+    return name == "APIConnectionError"
+
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+def get_breaker() -> CircuitBreaker:
+    # Created on first use so importing this module never touches the disk
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker()
+    return _breaker
+
+
+def is_open(model: str) -> bool:
+    return get_breaker().is_open(model)
+
+
+async def acquire(model: str):
+    await get_breaker().acquire(model)
+
+
+def record(model: str, error=None, deadline_limited: bool = False):
+    """
+    Report a finished call: error=None for success, else the raised exception.
+    Timeouts of deadline-limited calls are not recorded at all.
+    """
+    if error is None:
+        get_breaker().record_success(model)
+    elif counts_as_failure(error, deadline_limited):
+        get_breaker().record_failure(model)
+    elif deadline_limited and type(error).__name__ == "APITimeoutError":
+        return
+    else:
+        # Any answer from the upstream (even a 4xx/429) shows it is reachable
+        get_breaker().record_success(model)
+
+
+def stats() -> dict:
+    return get_breaker().stats()
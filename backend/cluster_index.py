@@ -0,0 +1,220 @@
+"""
+Symptom-Cluster Index
+Compiles the symptom_clusters.json catalog into:
+- a term index (every distinct core/related phrase -> term id), matched with
+  one Aho-Corasick pass per symptom plus a trigram index for partial symptoms
+  (both are plain substring tests, like the original scan)
+- canonical symptom IDs (see symptom_lexicon) -> term ids, for direct lookup
+- two sparse term x cluster matrices (core, related) in CSR form
+Scoring a request gathers the clusters touched by its matched terms and
+counts them for every cluster at once with NumPy, so latency depends on the
+number of matches rather than the size of the catalog.
+"""
+
+import os
+import json
+import threading
+from typing import List, Dict
+
+from keyword_matcher import KeywordMatcher, normalize
+from symptom_lexicon import canonical_id
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+SYMPTOM_CLUSTERS_PATH = os.getenv("SYMPTOM_CLUSTERS_PATH", os.path.join(current_dir, "symptom_clusters.json"))
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SparseTermMatrix:
+    """Term-major CSR matrix: row t lists the clusters containing term t"""
+
+    __slots__ = ("indptr", "indices")
+
+    def __init__(self, term_count: int, pairs: list):
+        import numpy as np
+
+        pairs = np.array(sorted(set(pairs)), dtype=np.int64).reshape(-1, 2)
+        counts = np.bincount(pairs[:, 0], minlength=term_count)
+        self.indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.indices = pairs[:, 1].copy()
+
+    def count_clusters(self, symptom_ids, term_ids, cluster_count: int):
+        """
+        For (symptom, term) hit pairs, count per cluster how many distinct
+        symptoms hit at least one of its terms.
+        """
+        import numpy as np
+
+        if not len(term_ids):
+            return np.zeros(cluster_count, dtype=np.int64)
+
+        starts = self.indptr[term_ids]
+        lengths = self.indptr[term_ids + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.zeros(cluster_count, dtype=np.int64)
+
+        # Gather every cluster of every hit term in one shot
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        clusters = self.indices[offsets]
+        symptoms = np.repeat(symptom_ids, lengths)
+
+        # A symptom counts once per cluster, however many of its terms matched
+        pairs = np.unique(symptoms * cluster_count + clusters)
+        return np.bincount(pairs % cluster_count, minlength=cluster_count)
+
+
+class ClusterIndex:
+
+    def __init__(self, clusters: Dict[str, Dict]):
+        import numpy as np
+
+        self.names = list(clusters)
+        self.severities = [clusters[name].get("severity", "unknown") for name in self.names]
+
+        self.terms = []
+        self.term_ids = {}
+        core_pairs, related_pairs = [], []
+        for c, name in enumerate(self.names):
+            for field, pairs in (("core_symptoms", core_pairs), ("related_symptoms", related_pairs)):
+                for term in clusters[name].get(field, []):
+                    pairs.append((self._term_id(term), c))
+
+        self.core = SparseTermMatrix(len(self.terms), core_pairs)
+        self.related = SparseTermMatrix(len(self.terms), related_pairs)
+        self.core_totals = np.bincount(
+            np.array([c for _, c in set(core_pairs)], dtype=np.int64), minlength=len(self.names)
+        )
+
+        # "term in symptom": one automaton pass over the symptom text
+        self._matcher = KeywordMatcher()
+        for term_id, term in enumerate(self.terms):
+            self._matcher.add(term, {"term_id": term_id}, whole_word=False)
+        self._matcher.build()
+
+        # Canonical symptom ID -> term ids (several synonyms may share an ID)
+        self.id_terms = {}
+        for term_id, term in enumerate(self.terms):
+            self.id_terms.setdefault(canonical_id(term), []).append(term_id)
+
+        # "symptom in term": candidate terms share every trigram of the symptom
+        self._trigram_index = {}
+        for term_id, term in enumerate(self.terms):
+            for gram in _trigrams(term):
+                self._trigram_index.setdefault(gram, set()).add(term_id)
+
+    def _term_id(self, term: str) -> int:
+        term = normalize(term)
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = self.term_ids[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def match_terms(self, symptom: str) -> List[int]:
+        """
+        Term ids related to a free-text symptom: catalog terms found inside it
+        ('headache' in 'severe headache') and terms that contain it
+        ('pain' in 'chest pain', 'head' in 'headache').
+        """
+        symptom = normalize(symptom)
+        if not symptom:
+            return []
+        ids = {m["term_id"] for m in self._matcher.match(symptom)}
+
+        grams = _trigrams(symptom)
+        if grams:
+            postings = sorted((self._trigram_index.get(g, set()) for g in grams), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            # Too short for a trigram; rare enough to scan
+            candidates = range(len(self.terms))
+        ids.update(t for t in candidates if symptom in self.terms[t])
+        return sorted(ids)
+
+    def score(self, symptom_terms: List[List[int]]):
+        """
+        Core/related match counts for every cluster, given each symptom's term ids.
+        Returns (core_matches, related_matches) arrays indexed by cluster.
+        """
+        import numpy as np
+
+        symptom_ids = np.repeat(np.arange(len(symptom_terms)), [len(t) for t in symptom_terms])
+        term_ids = np.fromiter((t for terms in symptom_terms for t in terms), dtype=np.int64, count=len(symptom_ids))
+        cluster_count = len(self.names)
+        return (
+            self.core.count_clusters(symptom_ids, term_ids, cluster_count),
+            self.related.count_clusters(symptom_ids, term_ids, cluster_count)
+        )
+
+    def terms_for(self, symptom: str) -> List[int]:
+        """Term ids for a canonical symptom ID (direct lookup) or free text"""
+        term_ids = self.id_terms.get(symptom)
+        return term_ids if term_ids is not None else self.match_terms(symptom)
+
+    def match(self, symptoms: List[str], limit: int = 10):
+        """
+        Rank clusters with at least one core match by core match percentage.
+        symptoms may be canonical IDs (from symptom_lexicon) or free text.
+        Returns (top `limit` match dicts, total number of matching clusters).
+        """
+        import numpy as np
+
+        core, related = self.score([self.terms_for(s) for s in symptoms])
+
+        matched = np.flatnonzero(core)
+        if not len(matched):
+            return [], 0
+        percentages = np.round(core[matched] / self.core_totals[matched] * 100, 1)
+        # Highest percentage first; catalog order breaks ties
+        order = np.lexsort((matched, -percentages))[:limit]
+
+        matches = []
+        for i in order:
+            c = matched[i]
+            pct = float(percentages[i])
+            matches.append({
+                "condition": self.names[c].replace("_", " ").title(),
+                "core_matches": int(core[c]),
+                "related_matches": int(related[c]),
+                "match_percentage": pct,
+                "severity": self.severities[c],
+                "confidence": "high" if pct >= 75 else "medium" if pct >= 50 else "low"
+            })
+        return matches, len(matched)
+
+
+def catalog_terms(path: str = SYMPTOM_CLUSTERS_PATH) -> List[str]:
+    """Every core/related phrase in the catalog (no index build)"""
+    with open(path, "r", encoding="utf-8") as f:
+        clusters = json.load(f)
+    return [
+        term
+        for cluster in clusters.values()
+        for field in ("core_symptoms", "related_symptoms")
+        for term in cluster.get(field, [])
+    ]
+
+
+def load_cluster_index(path: str = SYMPTOM_CLUSTERS_PATH) -> ClusterIndex:
+    with open(path, "r", encoding="utf-8") as f:
+        clusters = json.load(f)
+    index = ClusterIndex(clusters)
+    print(f"✅ [Clusters] Compiled {len(index.names)} clusters over {len(index.terms)} terms")
+    return index
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_cluster_index() -> ClusterIndex:
+    """Shared index, compiled from the catalog file on first use"""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = load_cluster_index()
+    return _index
@@ -0,0 +1,177 @@
+"""
+Request Deadlines
+Every API request gets an absolute deadline, set by DeadlineMiddleware and
+carried in a context variable, so it reaches every Groq, Chroma and Firestore
+call made on the request's behalf (including worker threads, which inherit
+the context) without threading it through each function signature.
+The budget covers the handler's work: the clock restarts once the request
+body has arrived (a slow upload isn't charged for it), and once a response
+has started streaming (SSE, file downloads) the middleware no longer cuts
+it off; calls made while streaming still see the deadline.
+Clients may shorten, never extend, the budget with an X-Request-Timeout header.
+"""
+
+import os
+import json
+import time
+import asyncio
+import contextvars
+
+import metrics
+
+# Default budget per request, with per-path overrides (seconds)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "20"))
+try:
+    ROUTE_DEADLINES = json.loads(os.getenv("ROUTE_DEADLINES", "{}"))
+except ValueError:
+    print("⚠️ [Deadline] ROUTE_DEADLINES is not valid JSON, using defaults")
+    ROUTE_DEADLINES = {}
+ROUTE_DEADLINES = {
+    "/api/check_emergency": 10,
+    "/api/triage": 10,
+    "/api/process_audio": 45,
+    "/api/analyze_prescription": 60,
+    # Streamed chat replies: retrieval plus the whole LLM stream
+    "/api/messages/send/stream": 120,
+    "/api/chat_with_guidelines/stream": 120,
+    **ROUTE_DEADLINES
+}
+# Extra time the middleware allows past the deadline before answering 504,
+# so handlers can return their own degraded response first
+DEADLINE_GRACE_SECONDS = float(os.getenv("DEADLINE_GRACE_SECONDS", "1"))
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call can't start or finish before the request deadline"""
+
+
+def set_deadline(seconds: float):
+    """Start a deadline `seconds` from now; returns a token for reset()"""
+    return _deadline.set(time.monotonic() + seconds)
+
+
+def reset(token):
+    _deadline.reset(token)
+
+
+def remaining() -> float:
+    """Seconds left before the deadline (None outside a request)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def timeout(cap: float = None) -> float:
+    """
+    Timeout for one downstream call: the time left, capped at `cap`.
+    None means no deadline and no cap (the client library's default applies).
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    return left if cap is None else min(left, cap)
+
+
+def check(what: str = "call"):
+    """Raise DeadlineExceeded if the deadline has already passed"""
+    if remaining() == 0:
+        metrics.incr("deadline.exceeded")
+        raise DeadlineExceeded(f"Request deadline passed before {what}")
+
+
+async def bound(awaitable, what: str = "call", cap: float = None):
+    """Await within the remaining request time (and `cap`), else DeadlineExceeded"""
+    check(what)
+    try:
+        return await asyncio.wait_for(awaitable, timeout(cap))
+    except asyncio.TimeoutError:
+        metrics.incr("deadline.exceeded")
+        raise DeadlineExceeded(f"{what} ran past the request deadline") from None
+
+
+def budget_for(path: str, headers) -> float:
+    budget = float(ROUTE_DEADLINES.get(path, REQUEST_DEADLINE_SECONDS))
+    requested = headers.get(b"x-request-timeout")
+    if requested:
+        try:
+            budget = min(budget, max(0.0, float(requested)))
+        except ValueError:
+            pass
+    return budget
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware: sets the request deadline and answers 504 if the handler
+    hasn't started its response DEADLINE_GRACE_SECONDS after it. Each request
+    body chunk restarts the clock (only a stalled upload runs out of time).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        budget = budget_for(scope["path"], dict(scope["headers"]))
+        token = set_deadline(budget)
+        expires = time.monotonic() + budget
+        body_done = False
+        started = False
+
+        async def receive_wrapper():
+            nonlocal expires, body_done
+            message = await receive()
+            if not body_done and message["type"] == "http.request":
+                expires = time.monotonic() + budget
+                if not message.get("more_body", False):
+                    body_done = True
+                    # Runs in the handler's task: its calls get the full budget from here
+                    set_deadline(budget)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        task = asyncio.ensure_future(self.app(scope, receive_wrapper, send_wrapper))
+        try:
+            while True:
+                left = expires + DEADLINE_GRACE_SECONDS - time.monotonic()
+                await asyncio.wait({task}, timeout=max(0.0, left))
+                if task.done():
+                    return task.result()
+                if started:
+                    # Response body transfer isn't bounded here
+                    return await task
+                if time.monotonic() >= expires + DEADLINE_GRACE_SECONDS:
+                    break
+
+            task.cancel()
+            try:
+                await task
+            except BaseException:
+                pass
+            metrics.incr("deadline.requests_timed_out")
+            print(f"⏱️ [Deadline] {scope['path']} exceeded its {budget}s budget")
+            if started:
+                # The response began while the handler was being cancelled
+                return
+            body = json.dumps({"detail": f"Request exceeded its {budget}s deadline"}).encode()
+            await send({
+                "type": "http.response.start",
+                "status": 504,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+            })
+            await send({"type": "http.response.body", "body": body})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            reset(token)
@@ -0,0 +1,195 @@
+"""
+Persistent Query-Embedding Cache
+On-disk cache of text embeddings shared by every uvicorn worker.
+Vectors live in a flat float32 file read through a memory map; a small SQLite
+index maps sha1(model + text) -> row. Writers append under SQLite's write lock,
+so concurrent workers never claim the same row.
+"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction
+
+import metrics
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(current_dir, "embedding_cache"))
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_MAX_ROWS", "500000"))
+
+
+class EmbeddingStore:
+    """
+    Append-only (hash -> float32[dim]) store.
+    vectors.f32 holds row-major vectors; index.sqlite3 holds the hash -> row
+    map plus the vector dimension, fixed by the first write.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.index_path = os.path.join(directory, "index.sqlite3")
+        self._local = threading.local()
+        self._mmap = None
+        self._mmap_rows = 0
+        self._mmap_lock = threading.Lock()
+
+        if not os.path.exists(self.vectors_path):
+            open(self.vectors_path, "ab").close()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS vectors (hash TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.dim = self._read_dim()
+
+    def _read_dim(self):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _conn(self):
+        # One connection per thread; WAL lets readers proceed during writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _vectors(self, needed_rows: int):
+        """Memory map covering at least needed_rows rows (remapped as the file grows)"""
+        with self._mmap_lock:
+            if self._mmap is None or self._mmap_rows < needed_rows:
+                rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+                self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+                self._mmap_rows = rows
+            return self._mmap
+
+    def get_many(self, hashes: list) -> dict:
+        """Return {hash: vector} for the hashes present in the store"""
+        if not hashes:
+            return {}
+        if self.dim is None:
+            self.dim = self._read_dim()
+            if self.dim is None:
+                return {}
+        placeholders = ",".join("?" * len(hashes))
+        rows = self._conn().execute(
+            f"SELECT hash, row FROM vectors WHERE hash IN ({placeholders})", hashes
+        ).fetchall()
+        if not rows:
+            return {}
+
+        vectors = self._vectors(max(r for _, r in rows) + 1)
+        if vectors is None:
+            return {}
+        return {h: np.array(vectors[r]) for h, r in rows if r < len(vectors)}
+
+    def put_many(self, items: dict):
+        """Append {hash: vector} entries that aren't stored yet"""
+        if not items:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")  # serializes writers across processes
+        try:
+            dim = self._read_dim()
+            if dim is None:
+                dim = len(next(iter(items.values())))
+                conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+            self.dim = dim
+            row_bytes = dim * 4
+
+            next_row = os.path.getsize(self.vectors_path) // row_bytes
+            if next_row >= EMBEDDING_CACHE_MAX_ROWS:
+                conn.execute("ROLLBACK")
+                return
+
+            placeholders = ",".join("?" * len(items))
+            existing = {h for (h,) in conn.execute(
+                f"SELECT hash FROM vectors WHERE hash IN ({placeholders})", list(items)
+            )}
+            new = [(h, v) for h, v in items.items() if h not in existing and len(v) == dim]
+            if not new:
+                conn.execute("ROLLBACK")
+                return
+
+            # Vector bytes are written and flushed before the index rows commit,
+            # so readers never see a row that isn't on disk yet
+            with open(self.vectors_path, "r+b") as f:
+                f.seek(next_row * row_bytes)
+                f.write(np.stack([v for _, v in new]).astype(np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            conn.executemany(
+                "INSERT INTO vectors (hash, row) VALUES (?, ?)",
+                [(h, next_row + i) for i, (h, _) in enumerate(new)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """
+    Chroma embedding function that consults the on-disk cache first and only
+    runs the wrapped model for texts it hasn't embedded before.
+    """
+
+    def __init__(self, base, directory: str = EMBEDDING_CACHE_DIR):
+        self.base = base
+        self.directory = directory
+        self.model_name = f"{type(base).__name__}:{getattr(base, 'MODEL_NAME', '')}"
+        self._store = None
+        try:
+            self._store = EmbeddingStore(directory)
+        except Exception as e:
+            print(f"⚠️ [Embedding Cache] Disabled, could not open {directory}: {e}")
+
+    @staticmethod
+    def name() -> str:
+        # Stored vectors are identical to the default embedder's, so present as it
+        return "default"
+
+    def get_config(self):
+        return self.base.get_config()
+
+    @staticmethod
+    def build_from_config(config):
+        from chromadb.utils import embedding_functions
+        return CachedEmbeddingFunction(embedding_functions.DefaultEmbeddingFunction())
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def __call__(self, input):
+        texts = list(input)
+        keys = [self._key(t) for t in texts]
+
+        cached = {}
+        if self._store is not None:
+            try:
+                cached = self._store.get_many(list(set(keys)))
+            except Exception as e:
+                print(f"⚠️ [Embedding Cache] Read failed: {e}")
+
+        missing = [i for i, k in enumerate(keys) if k not in cached]
+        metrics.incr("embedding.cache.hits", len(texts) - len(missing))
+        metrics.incr("embedding.cache.misses", len(missing))
+
+        if missing:
+            computed = self.base([texts[i] for i in missing])
+            fresh = {}
+            for i, vector in zip(missing, computed):
+                fresh[keys[i]] = np.asarray(vector, dtype=np.float32)
+            cached.update(fresh)
+            if self._store is not None:
+                try:
+                    self._store.put_many(fresh)
+                except Exception as e:
+                    print(f"⚠️ [Embedding Cache] Write failed: {e}")
+
+        return [cached[k] for k in keys]
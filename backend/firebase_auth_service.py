@@ -5,6 +5,7 @@ Handles user signup, login, and profile management using Firebase
 
 from firebase_config import get_db, get_auth
 from firebase_admin import auth as admin_auth
+from firestore_service import rpc_timeout
 import traceback
 
 db = get_db()
@@ -26,7 +27,7 @@ def signup_user(email: str, password: str):
                 'email': email,
                 'profiles': [],
                 'created_at': admin_auth.UserRecord.user_metadata
-            })
+            }, timeout=rpc_timeout())
         
         return {
             "success": True,
@@ -62,7 +63,7 @@ def login_user(email: str, password: str):
         # Get user profile from Firestore
         user_data = {"email": email, "profiles": []}
         if db:
-            user_doc = db.collection('users').document(user.uid).get()
+            user_doc = db.collection('users').document(user.uid).get(timeout=rpc_timeout())
             if user_doc.exists:
                 user_data = user_doc.to_dict()
         
@@ -97,7 +98,7 @@ def add_profile(email: str, profile_data: dict):
         if db:
             # Get current profiles
             user_ref = db.collection('users').document(user.uid)
-            user_doc = user_ref.get()
+            user_doc = user_ref.get(timeout=rpc_timeout())
             
             profiles = []
             if user_doc.exists:
@@ -108,7 +109,7 @@ def add_profile(email: str, profile_data: dict):
             profiles.append(profile_data)
             
             # Update Firestore
-            user_ref.set({'profiles': profiles}, merge=True)
+            user_ref.set({'profiles': profiles}, merge=True, timeout=rpc_timeout())
         
         return {
             "success": True,
@@ -6,9 +6,24 @@ Handles saving and retrieving user data from Firestore
 from firebase_config import get_db
 from datetime import datetime
 import uuid
+import os
+
+import deadline
 
 db = get_db()
 
+# Per-RPC cap when no request deadline applies (scripts, background tasks)
+FIRESTORE_TIMEOUT = float(os.getenv("FIRESTORE_TIMEOUT", "10"))
+
+
+def rpc_timeout():
+    """
+    RPC timeout: the time left on the request deadline, capped at FIRESTORE_TIMEOUT
+    """
+    deadline.check("Firestore call")
+    return deadline.timeout(FIRESTORE_TIMEOUT)
+
+
 def save_prescription(user_id, profile_id, prescription_data):
     """
     Save prescription analysis to Firestore
@@ -39,7 +54,7 @@ def save_prescription(user_id, profile_id, prescription_data):
         }
         
         # Save to Firestore
-        db.collection('records').document(prescription_id).set(prescription_doc)
+        db.collection('records').document(prescription_id).set(prescription_doc, timeout=rpc_timeout())
         
         print(f"✅ Prescription saved: {prescription_id}")
         return {"success": True, "id": prescription_id}
@@ -73,7 +88,7 @@ def save_summary(user_id, profile_id, summary_data):
         }
         
         # Save to Firestore
-        db.collection('records').document(summary_id).set(summary_doc)
+        db.collection('records').document(summary_id).set(summary_doc, timeout=rpc_timeout())
         
         print(f"✅ Summary saved: {summary_id}")
         return {"success": True, "id": summary_id}
@@ -106,7 +121,7 @@ def get_user_records(user_id, profile_id=None):
         
         # Fetch all records (without ordering to avoid composite index requirement)
         records = []
-        for doc in query.stream():
+        for doc in query.stream(timeout=rpc_timeout()):
             record_data = doc.to_dict()
             records.append(record_data)
             print(f"   📄 Found: {record_data.get('id')} - {record_data.get('type')}")
@@ -135,7 +150,7 @@ def delete_record(record_id, user_id):
         
         # Verify ownership
         doc_ref = db.collection('records').document(record_id)
-        doc = doc_ref.get()
+        doc = doc_ref.get(timeout=rpc_timeout())
         
         if not doc.exists:
             return {"success": False, "error": "Record not found"}
@@ -145,7 +160,7 @@ def delete_record(record_id, user_id):
             return {"success": False, "error": "Unauthorized"}
         
         # Delete
-        doc_ref.delete()
+        doc_ref.delete(timeout=rpc_timeout())
         
         print(f"✅ Record deleted: {record_id}")
         return {"success": True}
@@ -177,7 +192,7 @@ def save_medical_file(user_id, profile_id, file_data):
         }
         
         # Save to Firestore
-        db.collection('records').document(record_id).set(record_doc)
+        db.collection('records').document(record_id).set(record_doc, timeout=rpc_timeout())
         
         print(f"✅ Medical file record saved: {record_id}")
         return {"success": True, "id": record_id}
@@ -229,7 +244,7 @@ def save_appointment(appointment_data):
         }
         
         # Save to Firestore
-        db.collection('appointments').document(appointment_id).set(appointment_doc)
+        db.collection('appointments').document(appointment_id).set(appointment_doc, timeout=rpc_timeout())
         
         print(f"✅ Appointment saved: {appointment_id}")
         return {"success": True, "id": appointment_id, "data": appointment_doc}
@@ -259,7 +274,7 @@ def get_user_appointments(user_id, profile_id=None):
             query = query.where('profile_id', '==', str(profile_id))
         
         # Get documents
-        docs = query.stream()
+        docs = query.stream(timeout=rpc_timeout())
         
         appointments = []
         for doc in docs:
@@ -318,7 +333,7 @@ def update_appointment_status(appointment_id, status):
         db.collection('appointments').document(appointment_id).update({
             'status': status,
             'updated_at': datetime.now().isoformat()
-        })
+        }, timeout=rpc_timeout())
         
         print(f"✅ Appointment status updated")
         return {"success": True}
@@ -347,7 +362,7 @@ def get_doctor_appointments(doctor_uid):
         query = db.collection('appointments').where('doctor_uid', '==', str(doctor_uid))
         
         # Get documents
-        docs = query.stream()
+        docs = query.stream(timeout=rpc_timeout())
         
         appointments = []
         for doc in docs:
@@ -387,7 +402,7 @@ def get_incoming_records():
         query = db.collection('records').order_by('created_at', direction='DESCENDING').limit(50)
         
         # Get documents
-        docs = query.stream()
+        docs = query.stream(timeout=rpc_timeout())
         
         records = []
         for doc in docs:
@@ -429,7 +444,7 @@ def update_appointment_with_notes(appointment_id, status, notes):
             'consultation_notes': notes,
             'completed_at': datetime.now().isoformat() if status == 'completed' else None,
             'updated_at': datetime.now().isoformat()
-        })
+        }, timeout=rpc_timeout())
         
         print(f"✅ Appointment updated with notes")
         return {"success": True}
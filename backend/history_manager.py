@@ -0,0 +1,232 @@
+"""
+Chat History Manager
+Keeps chat prompts within a per-model token budget.
+The last K turns are sent verbatim; older turns are folded into a rolling
+summary that is extended incrementally as turns age out of the window.
+Folding runs as a background task (at most one per session): until it has
+finished, the turns it covers are still sent verbatim with the previous
+summary, so every turn is always in either the summary or the window.
+The fold position is remembered by the last folded turn's message id (or a
+content fingerprint for client-supplied histories), so it survives the
+message store sliding its retention window.
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+import deadline
+import metrics
+from llm_client import chat_completion
+from llm_scheduler import PRIORITY_ENRICHMENT
+
+# Token budget for conversation history, per model
+# (override with HISTORY_TOKEN_BUDGETS='{"model": tokens}')
+MODEL_HISTORY_BUDGETS = {
+    "llama-3.3-70b-versatile": 3000,
+    "llama-3.1-8b-instant": 1500,
+}
+try:
+    MODEL_HISTORY_BUDGETS.update(json.loads(os.getenv("HISTORY_TOKEN_BUDGETS", "{}")))
+except ValueError:
+    print("⚠️ [History] HISTORY_TOKEN_BUDGETS is not valid JSON, using defaults")
+# Budget for models without an entry above
+DEFAULT_HISTORY_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+
+# Number of most recent turns (messages) kept verbatim
+KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "6"))
+
+# Model used to fold old turns into the summary, and its time budget
+SUMMARY_MODEL = "llama-3.1-8b-instant"
+SUMMARY_TIMEOUT = float(os.getenv("HISTORY_SUMMARY_TIMEOUT", "30"))
+
+# Rolling summaries kept in memory (LRU)
+MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "5000"))
+
+# session_id -> {"summary", "through": key of the last folded turn, "order":
+# its (timestamp, seq) if known, "index": its position, "folding", "generation"}
+_sessions = OrderedDict()
+_tasks = set()  # strong references so running folds aren't garbage-collected
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token for English text)
+    """
+    return len(text) // 4 + 1 if text else 0
+
+
+def normalize_turn(msg: dict) -> dict:
+    """
+    Accept both {"role", "content"} and {"sender", "message"} shaped turns
+    """
+    if "role" in msg:
+        role = "user" if msg.get("role") == "user" else "assistant"
+        content = msg.get("content", "")
+    else:
+        role = "user" if msg.get("sender") in ("user", "patient") else "assistant"
+        content = msg.get("message", "")
+    return {"role": role, "content": content}
+
+
+def turn_key(msg: dict, turn: dict) -> str:
+    """Stable identity of a turn: its message id, else a content fingerprint"""
+    if msg.get("id"):
+        return str(msg["id"])
+    return hashlib.sha1(f"{turn['role']}\x00{turn['content']}".encode("utf-8")).hexdigest()
+
+
+def turn_order(msg: dict):
+    """(timestamp, id sequence) for stored messages, None for client-supplied turns"""
+    if msg.get("timestamp") is None:
+        return None
+    digits = "".join(c for c in str(msg.get("id", "")) if c.isdigit())
+    return (msg["timestamp"], int(digits) if digits else 0)
+
+
+def _get_state(session_id: str) -> dict:
+    state = _sessions.get(session_id)
+    if state is None:
+        state = _sessions[session_id] = {
+            "summary": "", "through": None, "order": None, "index": 0, "folding": False, "generation": 0
+        }
+        if len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+    else:
+        _sessions.move_to_end(session_id)
+    return state
+
+
+def _reset(state: dict):
+    state.update(summary="", through=None, order=None, index=0)
+    state["generation"] += 1
+
+
+def _folded_count(state: dict, keys: list, orders: list):
+    """
+    Number of leading turns already covered by the summary, or None if this
+    history doesn't continue the summarized conversation.
+    """
+    if state["through"] is None:
+        return 0
+    index = state["index"]
+    if index < len(keys) and keys[index] == state["through"]:
+        return index + 1
+    for i in range(len(keys) - 1, -1, -1):
+        if keys[i] == state["through"]:
+            return i + 1
+    if state["order"] is not None and orders and orders[0] is not None and orders[0] > state["order"]:
+        # The last folded turn slid out of the retained window; every turn here is newer
+        return 0
+    return None
+
+
+async def _fold_into_summary(previous_summary: str, turns: list) -> str:
+    """
+    Extend an existing summary with newly aged-out turns
+    """
+    transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+    prompt = f"""Current summary of the earlier conversation:
+{previous_summary or "(none yet)"}
+
+New turns to add:
+{transcript}
+
+Update the summary to include the new turns. Keep every symptom, duration, medication,
+allergy and advice given. Reply with the updated summary only, at most 120 words."""
+
+    completion = await chat_completion(
+        priority=PRIORITY_ENRICHMENT,
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "You maintain concise running summaries of medical chats."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.1,
+        max_tokens=200
+    )
+    return completion.choices[0].message.content.strip()
+
+
+async def _fold(state: dict, generation: int, turns: list, through: str, order, index: int):
+    # Runs after the request that scheduled it; give it its own deadline
+    deadline.set_deadline(SUMMARY_TIMEOUT)
+    try:
+        summary = await _fold_into_summary(state["summary"], turns)
+    except Exception as e:
+        print(f"⚠️ [History] Summary update failed, keeping previous summary: {e}")
+        return
+    finally:
+        state["folding"] = False
+    if state["generation"] != generation:
+        # The session started a new history while this ran
+        return
+    state.update(summary=summary, through=through, order=order, index=index)
+    metrics.incr("chat.history.summary_updates")
+
+
+async def build_history(session_id: str, history: list, model: str):
+    """
+    Build the history portion of a prompt within the model's token budget.
+    History entries may carry the message store's "id" and "timestamp".
+
+    Returns:
+        (messages, stats) where messages is a list of {"role", "content"} dicts
+        and stats reports history tokens before/after windowing.
+    """
+    history = history or []
+    turns = [normalize_turn(m) for m in history]
+    keys = [turn_key(m, t) for m, t in zip(history, turns)]
+    orders = [turn_order(m) for m in history]
+    budget = MODEL_HISTORY_BUDGETS.get(model, DEFAULT_HISTORY_BUDGET)
+    full_tokens = sum(estimate_tokens(t["content"]) for t in turns)
+
+    state = _get_state(session_id)
+    folded = _folded_count(state, keys, orders)
+    if folded is None:
+        # Client started a new or different history; the old summary no longer applies
+        _reset(state)
+        folded = 0
+
+    # Verbatim window: last KEEP_TURNS turns, shrunk further if over budget
+    start = max(folded, len(turns) - KEEP_TURNS)
+    window_tokens = sum(estimate_tokens(t["content"]) for t in turns[start:])
+    summary_tokens = estimate_tokens(state["summary"])
+    while start < len(turns) - 1 and window_tokens + summary_tokens > budget:
+        window_tokens -= estimate_tokens(turns[start]["content"])
+        start += 1
+
+    # Fold the turns that aged out since the last fold in the background
+    if start > folded and not state["folding"]:
+        state["folding"] = True
+        task = asyncio.create_task(_fold(
+            state, state["generation"], turns[folded:start], keys[start - 1], orders[start - 1], start - 1
+        ))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+    # Turns not yet in the summary stay verbatim (briefly over budget) until their fold lands
+    if start > folded:
+        metrics.incr("chat.history.fold_pending")
+        start = folded
+
+    messages = []
+    if state["summary"]:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation: {state['summary']}"
+        })
+    messages.extend(turns[start:])
+
+    used_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+    stats = {
+        "history_tokens": full_tokens,
+        "prompt_history_tokens": used_tokens,
+        "tokens_saved": max(0, full_tokens - used_tokens),
+        "verbatim_turns": len(turns) - start,
+        "summarized_turns": folded
+    }
+    metrics.observe("chat.history.tokens_saved", stats["tokens_saved"])
+    return messages, stats
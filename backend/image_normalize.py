@@ -0,0 +1,79 @@
+"""
+Prescription Image Normalization
+Phone photos arrive as ~12 MP JPEGs, often rotated via EXIF. Before OCR or
+the vision upload every image is normalized once:
+- decoded straight to grayscale, at 1/2-1/8 scale when the JPEG decoder can
+  land inside the pixel budget (text needs no color; every later step does
+  1/3 of the work)
+- downsampled to the budget: OCR_MAX_PIXELS (~200 DPI across A4, ~290 DPI
+  across an A5 prescription pad) or VISION_MAX_PIXELS for the cloud model
+- EXIF orientation applied last, on the small image
+- re-encoded compactly (JPEG) when the image has to be uploaded
+Pillow is imported inside the functions so OCR pool workers stay light.
+"""
+
+import io
+import os
+
+# Pixel budget for Tesseract; decoder downscaling may go as low as the minimum
+OCR_MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", "4000000"))
+OCR_MIN_PIXELS = int(os.getenv("OCR_MIN_PIXELS", "2500000"))
+# The vision model downsamples anyway; this keeps the base64 payload small
+VISION_MAX_PIXELS = int(os.getenv("VISION_MAX_PIXELS", "1500000"))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "80"))
+
+# EXIF orientation -> transpose that undoes it (as ImageOps.exif_transpose)
+_ORIENTATION_TRANSPOSE = {2: "FLIP_LEFT_RIGHT", 3: "ROTATE_180", 4: "FLIP_TOP_BOTTOM",
+                          5: "TRANSPOSE", 6: "ROTATE_270", 7: "TRANSVERSE", 8: "ROTATE_90"}
+
+
+def _target_size(size: tuple, max_pixels: int) -> tuple:
+    width, height = size
+    if width * height <= max_pixels:
+        return size
+    scale = (max_pixels / (width * height)) ** 0.5
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def normalize_image(image_bytes: bytes, max_pixels: int = OCR_MAX_PIXELS, min_pixels: int = OCR_MIN_PIXELS):
+    """
+    Decode, grayscale, downsample and orient an uploaded image.
+    Returns a Pillow image in mode "L" of at most max_pixels pixels; JPEG
+    decoder scaling is used when it stays at or above min_pixels.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    orientation = image.getexif().get(0x0112, 1)
+
+    # The decoder picks the largest 1/2^n reduction that is still at least this size
+    if image.format == "JPEG":
+        image.draft("L", _target_size(image.size, min_pixels))
+
+    if image.mode in ("RGBA", "LA", "P"):
+        # Flatten transparency onto white so it doesn't turn black in grayscale
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, "white")
+        image = Image.alpha_composite(background, image)
+    image = image.convert("L")
+
+    target = _target_size(image.size, max_pixels)
+    if target != image.size:
+        # Antialiased bicubic keeps stroke edges for OCR at ~2/3 of Lanczos' cost;
+        # reducing_gap does large reductions with a fast integer box pass first
+        image = image.resize(target, Image.BICUBIC, reducing_gap=2.0)
+
+    # Rotating doesn't change the pixel count, so it's done on the small image
+    method = _ORIENTATION_TRANSPOSE.get(orientation)
+    if method:
+        image = image.transpose(getattr(Image.Transpose, method))
+    return image
+
+
+def normalize_for_vision(image_bytes: bytes, max_pixels: int = VISION_MAX_PIXELS,
+                         quality: int = VISION_JPEG_QUALITY) -> bytes:
+    """Normalized grayscale JPEG bytes for the cloud vision request"""
+    image = normalize_image(image_bytes, max_pixels, max_pixels // 2)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
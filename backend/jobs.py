@@ -0,0 +1,178 @@
+"""
+Background Jobs
+Submit/poll interface for slow endpoints (prescription OCR): the request that
+submits a job returns a job id at once, the work runs as a task on this
+worker's event loop, and clients poll for its status, stage and result.
+Job records live in a small SQLite file so a poll answered by any uvicorn
+worker sees the job, whichever worker runs it. Finished jobs are pruned
+after JOB_TTL_SECONDS. A job still queued or running JOB_STALE_GRACE_SECONDS
+past its own timeout (e.g. its worker was restarted) is reported as failed.
+Store calls run in threads; writes go through a single thread so a job's
+stage updates land in order.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import deadline
+import metrics
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(current_dir, "jobs.sqlite3"))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "900"))
+# How long past its timeout an unfinished job may go before it is presumed lost
+JOB_STALE_GRACE_SECONDS = float(os.getenv("JOB_STALE_GRACE_SECONDS", "30"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobStore:
+
+    def __init__(self, path: str = JOB_STORE_PATH, ttl: float = JOB_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, stage TEXT, "
+            "result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+            "expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        # One connection per thread; WAL lets polls read while jobs are updated
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, kind: str, timeout: float) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM jobs WHERE updated_at < ?", (now - self.ttl,))
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, stage, created_at, updated_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, QUEUED, QUEUED, now, now, now + timeout)
+        )
+        return job_id
+
+    def update(self, job_id: str, status: str = None, stage: str = None, result=None, error: str = None):
+        fields = {"updated_at": time.time()}
+        if status is not None:
+            fields["status"] = status
+        if stage is not None:
+            fields["stage"] = stage
+        if result is not None:
+            fields["result"] = json.dumps(result, default=str)
+        if error is not None:
+            fields["error"] = error
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._conn().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> dict:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT id, kind, status, stage, result, error, created_at, updated_at, expires_at FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, kind, status, stage, result, error, created_at, updated_at, expires_at = row
+        if status in (QUEUED, RUNNING) and time.time() > expires_at + JOB_STALE_GRACE_SECONDS:
+            # Nothing will finish this job any more (its worker died or restarted)
+            status, error, updated_at = FAILED, "Job did not finish in time", time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                (status, error, updated_at, job_id, QUEUED, RUNNING)
+            )
+            metrics.incr(f"jobs.{kind}.stale")
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "stage": stage,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+_tasks = set()  # strong references so running jobs aren't garbage-collected
+_writer = ThreadPoolExecutor(1, thread_name_prefix="job-store")
+
+
+def get_store() -> JobStore:
+    # Opened on first use so importing this module never touches the disk
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = JobStore()
+    return _store
+
+
+async def submit(kind: str, work, timeout: float) -> str:
+    """
+    Start `work(progress)` as a background job and return its id.
+    `work` is an async callable; progress(stage) records the current stage.
+    The job gets its own `timeout`-second deadline instead of the submitting
+    request's.
+    """
+    loop = asyncio.get_running_loop()
+    store = await asyncio.to_thread(get_store)
+    job_id = await loop.run_in_executor(_writer, store.create, kind, timeout)
+    metrics.incr(f"jobs.{kind}.submitted")
+
+    def write(**fields):
+        # A lost status write must not take the job down with it
+        try:
+            store.update(job_id, **fields)
+        except sqlite3.Error as e:
+            print(f"⚠️ [Jobs] Could not update {kind} job {job_id}: {e}")
+
+    async def update(**fields):
+        await loop.run_in_executor(_writer, lambda: write(**fields))
+
+    def progress(stage):
+        # Queued on the writer thread right away, so it lands before the final status
+        _writer.submit(write, stage=stage)
+
+    async def runner():
+        # Tasks copy the submitter's context; give the job a fresh deadline
+        deadline.set_deadline(timeout)
+        await update(status=RUNNING)
+        started = time.perf_counter()
+        try:
+            result = await work(progress)
+            await update(status=DONE, stage=DONE, result=result)
+            metrics.incr(f"jobs.{kind}.done")
+        except Exception as e:
+            print(f"❌ [Jobs] {kind} job {job_id} failed: {e}")
+            await update(status=FAILED, error=str(e))
+            metrics.incr(f"jobs.{kind}.failed")
+        finally:
+            metrics.observe(f"jobs.{kind}.seconds", time.perf_counter() - started)
+
+    task = asyncio.create_task(runner())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job_id
+
+
+async def get(job_id: str) -> dict:
+    store = await asyncio.to_thread(get_store)
+    return await asyncio.to_thread(store.get, job_id)
@@ -0,0 +1,155 @@
+"""
+Multi-Pattern Keyword Matcher
+Aho-Corasick automaton built once from the critical keyword list and every
+symptom phrase in emergency_rules.json. Matching is a single linear pass
+over the normalized input and returns every matched rule category/condition.
+"""
+
+import re
+from typing import List, Dict
+
+_NON_WORD = re.compile(r"[^a-z0-9']+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, unify apostrophes, collapse everything else to single spaces"""
+    text = text.lower().replace("’", "'")
+    return " ".join(_NON_WORD.split(text)).strip()
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over normalized phrases.
+    Each pattern carries a payload dict that is returned when it matches.
+    """
+
+    def __init__(self):
+        self._goto = [{}]      # node -> {char: node}
+        self._fail = [0]
+        self._output = [[]]    # node -> [(pattern_length, payload)]
+        self._built = False
+        self.pattern_count = 0
+
+    def add(self, pattern: str, payload: dict, whole_word: bool = True):
+        """
+        Add a phrase. whole_word=True only matches on word boundaries;
+        whole_word=False keeps plain substring semantics (e.g. 'breathless' in 'breathlessness').
+        """
+        pattern = normalize(pattern)
+        if not pattern:
+            return
+        if whole_word:
+            pattern = f" {pattern} "
+
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append((len(pattern), payload))
+        self.pattern_count += 1
+        self._built = False
+
+    def build(self):
+        """Compute failure links (breadth-first) and merge outputs along them"""
+        queue = list(self._goto[0].values())
+        for child in queue:
+            self._fail[child] = 0
+
+        i = 0
+        while i < len(queue):
+            node = queue[i]
+            i += 1
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+        self._built = True
+        return self
+
+    def match(self, text: str) -> List[Dict]:
+        """Return payloads of every pattern found in text, in order of appearance"""
+        if not self._built:
+            self.build()
+
+        padded = f" {normalize(text)} "
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        matches = []
+        seen = set()
+        for pos, ch in enumerate(padded):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, payload in output[node]:
+                key = id(payload)
+                if key not in seen:
+                    seen.add(key)
+                    matches.append({**payload, "start": max(0, pos - length + 1)})
+        return matches
+
+
+_PAREN = re.compile(r"\(([^)]*)\)")
+
+
+def rule_phrases(symptom: str) -> List[str]:
+    """
+    Derive matchable phrases from a rule symptom description, e.g.
+    'Absent breathing (Apnea)' -> ['absent breathing', 'apnea']
+    'Sudden weakness/numbness on one side (Face, Arm, Leg)'
+        -> ['sudden weakness on one side', 'sudden numbness on one side']
+    """
+    phrases = []
+
+    # Parenthetical synonyms, only when they are a plain term (no lists or thresholds)
+    for inner in _PAREN.findall(symptom):
+        if not re.search(r"[,/>0-9]", inner):
+            phrases.append(inner)
+
+    main = _PAREN.sub(" ", symptom)
+    main = main.split(":")[0].split(" - ")[0]
+
+    # Expand single-word slash alternatives ("weakness/numbness")
+    variants = [[]]
+    for word in main.split():
+        options = word.split("/") if "/" in word else [word]
+        variants = [v + [o] for v in variants for o in options if o]
+    phrases.extend(" ".join(v) for v in variants)
+
+    result = []
+    for phrase in phrases:
+        phrase = normalize(phrase)
+        if phrase and phrase not in result:
+            result.append(phrase)
+    return result
+
+
+def build_rule_matcher(critical_keywords: List[str], rules: List[Dict]) -> KeywordMatcher:
+    """
+    Compile critical keywords (substring semantics, as before) and every
+    rule symptom phrase (whole-word) into one automaton.
+    """
+    matcher = KeywordMatcher()
+    for kw in critical_keywords:
+        matcher.add(kw, {"type": "keyword", "keyword": kw}, whole_word=False)
+
+    for rule in rules:
+        for symptom in rule.get("symptoms", []):
+            for phrase in rule_phrases(symptom):
+                matcher.add(phrase, {
+                    "type": "rule",
+                    "keyword": phrase,
+                    "category": rule.get("category"),
+                    "condition": symptom,
+                    "action": rule.get("action")
+                })
+    return matcher.build()
@@ -0,0 +1,106 @@
+"""
+Async LLM Client
+Async Groq calls for the chat, triage and prescription engines, made on the
+shared client from the resource registry.
+Every outbound call is admitted by the llm_scheduler (priority classes,
+per-model rate-limit buckets, retry-after backoff, backpressure) and bounded
+by the current request deadline.
+"""
+
+import circuit_breaker
+import deadline
+import llm_scheduler
+from llm_scheduler import PRIORITY_CHAT, estimate_tokens
+from resources import GROQ_API_KEY, get_groq
+from singleflight import SingleFlight, payload_hash
+
+if not GROQ_API_KEY:
+    print("⚠️ [LLM Client] GROQ_API_KEY not found in environment")
+
+# Identical concurrent completions (same model, priority and request payload) share one call
+_completions = SingleFlight("llm")
+
+
+def _client():
+    client = get_groq()
+    if not client:
+        raise RuntimeError("GROQ_API_KEY missing")
+    return client
+
+
+async def chat_completion(priority: int = PRIORITY_CHAT, **kwargs):
+    """
+    Run client.chat.completions.create without blocking the event loop.
+    Accepts the same keyword arguments as the Groq SDK, plus the scheduler
+    priority (llm_scheduler.PRIORITY_*). Identical in-flight requests at the
+    same priority are coalesced into one upstream call; callers must not
+    mutate the result.
+    Raises deadline.DeadlineExceeded if the request deadline passes first.
+    """
+    client = _client()
+
+    async def call(timeout):
+        raw = await client.chat.completions.with_raw_response.create(**kwargs, timeout=timeout)
+        completion = await raw.parse()
+        usage = getattr(completion, "usage", None)
+        return completion, getattr(usage, "total_tokens", None), raw.headers
+
+    model = kwargs.get("model")
+    # A joined call keeps running for the others if this request gives up.
+    # The priority is part of the key: joining a call queued at a lower
+    # priority would make an emergency caller wait behind enrichment work.
+    return await deadline.bound(
+        _completions.do(
+            (model, priority, payload_hash(kwargs)),
+            lambda: llm_scheduler.run(model, priority, estimate_tokens(kwargs), call)
+        ),
+        f"{model} completion"
+    )
+
+
+async def stream_chat_completion(priority: int = PRIORITY_CHAT, **kwargs):
+    """
+    Stream a chat completion, yielding content deltas as they arrive.
+    The scheduler slot is held until the stream is exhausted or closed.
+    Raises circuit_breaker.CircuitOpen before admission if the model is failing.
+    """
+    client = _client()
+    model = kwargs.get("model")
+    tokens = estimate_tokens(kwargs)
+    scheduler = llm_scheduler.get_scheduler()
+
+    await circuit_breaker.acquire(model)
+    await deadline.bound(scheduler.acquire(model, priority, tokens), f"{model} admission")
+    timeout, deadline_limited = llm_scheduler.call_timeout()
+    used, headers, retry_after = None, None, None
+    try:
+        raw = await client.chat.completions.with_raw_response.create(stream=True, **kwargs, timeout=timeout)
+        headers = raw.headers
+        stream = await raw.parse()
+        async for chunk in stream:
+            # Groq reports usage on the final chunk
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+            if usage is not None:
+                used = usage.total_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        circuit_breaker.record(model)
+    except Exception as e:
+        retry_after = llm_scheduler.retry_after_seconds(e)
+        circuit_breaker.record(model, e, deadline_limited)
+        raise
+    finally:
+        scheduler.release(model, tokens, used, headers, retry_after)
+
+
+async def transcribe_audio(priority: int = PRIORITY_CHAT, **kwargs):
+    """
+    Run client.audio.transcriptions.create through the same scheduler.
+    """
+    client = _client()
+
+    async def call(timeout):
+        raw = await client.audio.transcriptions.with_raw_response.create(**kwargs, timeout=timeout)
+        return await raw.parse(), None, raw.headers
+
+    return await llm_scheduler.run(kwargs.get("model"), priority, 0, call)
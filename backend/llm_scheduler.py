@@ -0,0 +1,325 @@
+"""
+Outbound LLM Scheduler
+Every Groq call in a worker is admitted through one scheduler:
+- priority classes: emergency triage > interactive (chat, audio, Rx) > enrichment
+- a token bucket per model for requests/minute and tokens/minute, corrected
+  after each call from the response's usage and x-ratelimit-* headers
+- 429s block the model for retry-after and are retried with jittered backoff
+- backpressure: once LLM_QUEUE_MAX calls are waiting, non-emergency callers
+  are rejected immediately with SchedulerSaturated
+- calls to a model whose shared circuit breaker is open fail immediately
+  with circuit_breaker.CircuitOpen
+- each call's SDK timeout is the time left on the request, capped at
+  LLM_CALL_TIMEOUT
+"""
+
+import os
+import re
+import json
+import time
+import heapq
+import random
+import asyncio
+import itertools
+
+import circuit_breaker
+import deadline
+import metrics
+
+PRIORITY_EMERGENCY = 0
+PRIORITY_CHAT = 1
+PRIORITY_ENRICHMENT = 2
+PRIORITY_NAMES = {PRIORITY_EMERGENCY: "emergency", PRIORITY_CHAT: "chat", PRIORITY_ENRICHMENT: "enrichment"}
+
+# Max concurrent Groq calls per worker (override with LLM_MAX_CONCURRENCY)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Waiting calls beyond which non-emergency calls are rejected
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "64"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# SDK timeout for one Groq call when the request deadline leaves more time
+LLM_CALL_TIMEOUT = float(os.getenv("LLM_CALL_TIMEOUT", "60"))
+# Rate-limit token estimate per image in a vision prompt
+LLM_IMAGE_TOKENS = int(os.getenv("LLM_IMAGE_TOKENS", "600"))
+
+# Per-model limits; the token limit is replaced by Groq's x-ratelimit-limit-tokens
+GROQ_RPM = float(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = float(os.getenv("GROQ_TPM", "6000"))
+try:
+    GROQ_RATE_LIMITS = json.loads(os.getenv("GROQ_RATE_LIMITS", "{}"))
+except ValueError:
+    print("⚠️ [LLM Scheduler] GROQ_RATE_LIMITS is not valid JSON, using defaults")
+    GROQ_RATE_LIMITS = {}
+
+
+class SchedulerSaturated(RuntimeError):
+    """Raised when the outbound queue is full (backpressure)"""
+
+
+_DURATION = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+
+def parse_duration(value) -> float:
+    """Groq reset durations ('7.66s', '2m59.56s', '120ms') -> seconds"""
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    scale = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(n) * scale[unit] for n, unit in _DURATION.findall(str(value)))
+
+
+class ModelBucket:
+    """Requests/minute and tokens/minute buckets for one model"""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests, self.tokens = rpm, tpm
+        self.blocked_until = 0.0
+        self._last = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last
+        self._last = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def wait_time(self, tokens: int) -> float:
+        """Seconds until a call of `tokens` estimated tokens fits (0 = now)"""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        # A call larger than the whole bucket only waits for a full bucket
+        tokens = min(tokens, self.tpm)
+        wait_requests = max(0.0, 1 - self.requests) * 60 / self.rpm
+        wait_tokens = max(0.0, tokens - self.tokens) * 60 / self.tpm
+        return max(wait_requests, wait_tokens)
+
+    def take(self, tokens: int):
+        self.requests -= 1
+        self.tokens -= min(tokens, self.tpm)
+
+    def settle(self, estimated: int, used: int = None, headers=None):
+        """Correct the bucket with the actual usage and the rate-limit headers"""
+        if used is not None:
+            self.tokens -= used - min(estimated, self.tpm)
+        if headers is None:
+            return
+        limit = headers.get("x-ratelimit-limit-tokens")
+        remaining = headers.get("x-ratelimit-remaining-tokens")
+        try:
+            if limit is not None:
+                self.tpm = float(limit)
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+        except ValueError:
+            pass
+        # Request headers track the daily quota; only honor exhaustion
+        if headers.get("x-ratelimit-remaining-requests") == "0":
+            self.block(parse_duration(headers.get("x-ratelimit-reset-requests")))
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    """
+    Prompt chars/4 plus the completion allowance. In multi-part (vision)
+    content only the text parts are counted; each image adds a fixed
+    LLM_IMAGE_TOKENS instead of the length of its base64 data URL.
+    """
+    chars, images = 0, 0
+    for message in kwargs.get("messages", []):
+        content = message.get("content", "")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+        else:
+            chars += len(str(content))
+    return chars // 4 + images * LLM_IMAGE_TOKENS + int(kwargs.get("max_tokens") or 512)
+
+
+class LLMScheduler:
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_QUEUE_MAX):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._queue = []   # heap of [priority, seq, model, tokens]
+        self._seq = itertools.count()
+        self._buckets = {}
+        self._changed = asyncio.Event()
+
+    def bucket(self, model: str) -> ModelBucket:
+        bucket = self._buckets.get(model)
+        if bucket is None:
+            limits = GROQ_RATE_LIMITS.get(model, {})
+            bucket = self._buckets[model] = ModelBucket(
+                float(limits.get("rpm", GROQ_RPM)), float(limits.get("tpm", GROQ_TPM))
+            )
+        return bucket
+
+    def _ready(self, entry) -> float:
+        """0 if entry may start now, else seconds to wait (None = until notified)"""
+        free = self.max_concurrency - self.in_flight
+        if free <= 0:
+            return None
+        _, _, model, tokens = entry
+
+        # Strict priority per model, and free slots go to higher-priority calls
+        # first; a call blocked on one model's limits doesn't hold up the others
+        runnable_ahead = 0
+        models_ahead = set()
+        for other in sorted(self._queue):
+            if other is entry:
+                break
+            if other[2] == model:
+                return None
+            if other[2] not in models_ahead and self.bucket(other[2]).wait_time(other[3]) <= 0:
+                runnable_ahead += 1
+            models_ahead.add(other[2])
+        if runnable_ahead >= free:
+            return None
+        return self.bucket(model).wait_time(tokens)
+
+    def _notify(self):
+        # Wake every waiter to re-check; a fresh event collects the next round
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def acquire(self, model: str, priority: int, tokens: int):
+        """Wait for a slot (priority order, model limits); call release() after"""
+        if priority != PRIORITY_EMERGENCY and len(self._queue) >= self.max_queue:
+            metrics.incr("llm.scheduler.rejected")
+            raise SchedulerSaturated(f"LLM queue full ({len(self._queue)} waiting)")
+
+        entry = [priority, next(self._seq), model, tokens]
+        started = time.perf_counter()
+        heapq.heappush(self._queue, entry)
+        try:
+            while True:
+                wait = self._ready(entry)
+                if wait is not None and wait <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._changed.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+            self._notify()
+
+        self.bucket(model).take(tokens)
+        self.in_flight += 1
+        metrics.observe(f"llm.scheduler.wait_seconds.{PRIORITY_NAMES.get(priority, priority)}", time.perf_counter() - started)
+
+    def release(self, model: str, estimated: int, used: int = None, headers=None, retry_after: float = None):
+        """Free the slot and settle the model's bucket (safe in finally blocks)"""
+        self.in_flight -= 1
+        bucket = self.bucket(model)
+        bucket.settle(estimated, used, headers)
+        if retry_after:
+            bucket.block(retry_after)
+        self._notify()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": {
+                PRIORITY_NAMES[p]: sum(1 for e in self._queue if e[0] == p) for p in PRIORITY_NAMES
+            },
+            "models": {
+                model: {
+                    "requests_available": round(b.requests, 1),
+                    "tokens_available": round(b.tokens),
+                    "tpm": b.tpm,
+                    "blocked_for": round(max(0.0, b.blocked_until - time.monotonic()), 2)
+                }
+                for model, b in self._buckets.items()
+            }
+        }
+
+
+_scheduler = None
+_scheduler_loop = None
+
+
+def get_scheduler() -> LLMScheduler:
+    # Created lazily (one per event loop) so its events bind to the running loop
+    global _scheduler, _scheduler_loop
+    loop = asyncio.get_running_loop()
+    if _scheduler is None or _scheduler_loop is not loop:
+        _scheduler = LLMScheduler()
+        _scheduler_loop = loop
+    return _scheduler
+
+
+def retry_after_seconds(error) -> float:
+    """retry-after from a failed call's response headers (None if absent)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    return parse_duration(headers.get("retry-after")) or None
+
+
+def _is_retryable(error) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def call_timeout():
+    """
+    SDK timeout for the next call -> (seconds, deadline_limited).
+    deadline_limited is True when the request deadline, not LLM_CALL_TIMEOUT,
+    set the timeout: a timeout then reflects the caller's budget, not the
+    upstream's health, and isn't reported to the circuit breaker.
+    """
+    seconds = deadline.timeout(LLM_CALL_TIMEOUT)
+    return seconds, seconds < LLM_CALL_TIMEOUT
+
+
+async def run(model: str, priority: int, tokens: int, call):
+    """
+    Run `call(timeout)` -> (result, used_tokens, headers) under the scheduler,
+    retrying rate-limit / transient failures with jittered backoff.
+    Queueing and retries stop at the request deadline, and at an open circuit.
+    """
+    scheduler = get_scheduler()
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await circuit_breaker.acquire(model)
+        await deadline.bound(scheduler.acquire(model, priority, tokens), f"{model} admission")
+        timeout, deadline_limited = call_timeout()
+        try:
+            result, used, headers = await call(timeout)
+        except Exception as e:
+            retry_after = retry_after_seconds(e)
+            scheduler.release(model, tokens, retry_after=retry_after)
+            circuit_breaker.record(model, e, deadline_limited)
+            if attempt >= LLM_MAX_RETRIES or not _is_retryable(e):
+                raise
+            if getattr(e, "status_code", None) == 429:
+                metrics.incr("llm.scheduler.rate_limited")
+            metrics.incr("llm.scheduler.retries")
+            base = retry_after or 0.5 * 2 ** attempt
+            delay = base + random.uniform(0, base * 0.5)
+            left = deadline.remaining()
+            if left is not None and delay >= left:
+                # No time left for another attempt
+                raise
+            print(f"🔁 [LLM Scheduler] {model} call failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled mid-call: free the slot without touching the bucket
+            scheduler.release(model, tokens)
+            raise
+        scheduler.release(model, tokens, used, headers)
+        circuit_breaker.record(model)
+        return result
@@ -0,0 +1,108 @@
+"""
+Load test for the async LLM path
+Starts a local Groq-compatible stub that takes STUB_DELAY seconds per completion,
+then fires N concurrent /api/triage requests at the app in-process.
+With a non-blocking engine N requests should finish in about the time of one.
+
+Usage: python load_test_triage.py [N]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+
+STUB_PORT = 8765
+STUB_DELAY = 1.0
+
+# Point the Groq SDK at the stub before any service module is imported
+os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{STUB_PORT}"
+os.environ.setdefault("GROQ_API_KEY", "stub-key")
+# The stub has no rate limits; keep the scheduler's buckets out of the measurement
+os.environ.setdefault("GROQ_RPM", "100000")
+os.environ.setdefault("GROQ_TPM", "100000000")
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+stub = FastAPI()
+
+
+@stub.post("/openai/v1/chat/completions")
+async def stub_completion():
+    await asyncio.sleep(STUB_DELAY)
+    content = json.dumps({
+        "is_emergency": False,
+        "matched_condition": None,
+        "action": "Monitor symptoms",
+        "reason": "stub",
+        "category": None,
+        "confidence": 0.95
+    })
+    return {
+        "id": "stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "stub",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    }
+
+
+def start_stub():
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=STUB_PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run(n):
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as http:
+        counter = iter(range(10 ** 9))
+
+        async def one():
+            # Unique text per request so the triage cache never short-circuits the LLM path
+            resp = await http.post("/api/triage", json={"symptoms": f"mild fever day {next(counter)}"})
+            resp.raise_for_status()
+
+        # Warm-up (lazy clients, embedder) is not part of the measurement
+        await one()
+
+        start = time.perf_counter()
+        await one()
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(n)])
+        concurrent = time.perf_counter() - start
+
+    print("\n" + "=" * 60)
+    print(f"1 request:   {single:.2f}s")
+    print(f"{n} requests: {concurrent:.2f}s (concurrent)")
+    print(f"Serial would be ~{single * n:.2f}s")
+    return single, concurrent
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    server = start_stub()
+    single, concurrent = asyncio.run(run(n))
+    server.should_exit = True
+
+    # Allow generous headroom for scheduling overhead
+    if concurrent > single * 2:
+        print("❌ Concurrent requests were serialized")
+        sys.exit(1)
+    print("✅ Concurrent requests overlapped")
@@ -1,7 +1,7 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
-from groq import Groq
 import os
 import shutil
 import json
@@ -9,10 +9,16 @@ from typing import List
 from dotenv import load_dotenv
 
 # --- IMPORT SERVICES ---
-from chat_engine import get_medical_response, generate_summary  
+from chat_engine import get_medical_response, stream_medical_response, generate_summary  
 from triage_service import analyze_symptom
-from prescription_analyzer import analyze_prescription
-from firebase_auth_service import signup_user, login_user, add_profile
+from llm_client import transcribe_audio
+from model_router import cascade_json
+from message_store import message_store
+from deadline import DeadlineMiddleware
+import metrics
+import warmup
+# Heavy subsystems (Firebase, Pillow/pytesseract, Chroma) are imported on first
+# use or by the background warm-up so uvicorn can bind immediately
 
 # Fix .env loading to be relative to this script
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -27,6 +33,44 @@ if not GROQ_API_KEY:
 # --- CONFIG & OTHERS ---
 app = FastAPI()
 
+def _load_firestore():
+    import firestore_service
+    import firebase_auth_service
+
+def _load_prescription_analyzer():
+    import prescription_analyzer
+
+def _load_knowledge_base():
+    from resources import GOLDEN_COLLECTION, REFERENCE_COLLECTION, get_collection
+    for name in (GOLDEN_COLLECTION, REFERENCE_COLLECTION):
+        if get_collection(name) is None:
+            raise RuntimeError(f"{name} unavailable")
+
+def _load_embedding_model():
+    from resources import warm_embedder
+    warm_embedder()
+
+def _load_vector_index():
+    from resources import warm_collections
+    print(f"🔥 [Warm-up] Synthetic queries run against {warm_collections()} collection(s)")
+
+# Embedder and HNSW segments first: they dominate the first triage's latency.
+# Both are optional: offline (model not downloadable) triage still answers,
+# without the semantic cache and RAG context
+warmup.register("embedding_model", _load_embedding_model, required=False)
+warmup.register("vector_index", _load_vector_index, required=False)
+warmup.register("firestore", _load_firestore)
+warmup.register("prescription_analyzer", _load_prescription_analyzer)
+warmup.register("knowledge_base", _load_knowledge_base, required=False)
+
+@app.on_event("startup")
+async def start_warmup():
+    warmup.start_background_warmup()
+
+# Per-request deadline for every downstream call (added first so CORS
+# headers are still applied to its 504 responses)
+app.add_middleware(DeadlineMiddleware)
+
 # Enable CORS for seamless communication with your React frontend
 app.add_middleware(
     CORSMiddleware,
@@ -36,12 +80,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-try:
-    client = Groq(api_key=GROQ_API_KEY)
-    print(f"✅ Groq client initialized successfully")
-except Exception as e:
-    print(f"❌ Failed to initialize Groq client: {e}")
-    raise
 
 # --- DATA MODELS ---
 class ChatMessage(BaseModel):
@@ -92,6 +130,7 @@ api_router = APIRouter(prefix="/api")
 
 @api_router.post("/signup")
 async def signup_endpoint(req: SignupRequest):
+    from firebase_auth_service import signup_user
     result = signup_user(
         req.email, 
         req.password, 
@@ -110,6 +149,7 @@ async def signup_endpoint(req: SignupRequest):
 
 @api_router.post("/login")
 async def login_endpoint(req: LoginRequest):
+    from firebase_auth_service import login_user
     result = login_user(req.email, req.password)
     if not result["success"]:
         raise HTTPException(status_code=401, detail=result["error"])
@@ -117,6 +157,7 @@ async def login_endpoint(req: LoginRequest):
 
 @api_router.post("/add_profile")
 async def add_profile_endpoint(req: AddProfileRequest):
+    from firebase_auth_service import add_profile
     result = add_profile(
         req.email,
         {
@@ -132,12 +173,77 @@ async def add_profile_endpoint(req: AddProfileRequest):
     return result
 
 
-# --- LEGACY/COMPATIBILITY DATA ---
-# Simple in-memory storage for the demo. In production, this would be SQLite/Postgres.
-MESSAGES_DB = [] 
+# --- HELPERS ---
+
+def conversation_history(conversation):
+    """
+    Convert a stored conversation to ChatFormat for the Engine
+    (id and timestamp let the history manager track what it has summarized)
+    """
+    chat_history = []
+    for m in conversation.recent():
+        role = "user" if m["sender"] == "patient" else "assistant"
+        chat_history.append({"role": role, "content": m["message"], "id": m["id"], "timestamp": m["timestamp"]})
+    return chat_history
+
+def sse_response(deltas, on_complete=None):
+    """
+    Wrap an async iterator of text deltas as a Server-Sent Events response.
+    Emits {"delta": ...} events followed by a final {"done": true, "reply": ...},
+    or by {"error": ..., "reply": <partial text>} if the upstream fails mid-reply.
+    on_complete receives the full text, only once the reply has finished;
+    interrupted replies (upstream error, client disconnect) are not persisted.
+    """
+    async def events():
+        parts = []
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+        except Exception:
+            error = "The reply was interrupted, please try again."
+            yield f"data: {json.dumps({'error': error, 'reply': ''.join(parts)})}\n\n"
+            return
+        if on_complete and parts:
+            await on_complete("".join(parts))
+        yield f"data: {json.dumps({'done': True, 'reply': ''.join(parts)})}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # --- ENDPOINTS ---
 
+@api_router.get("/health")
+async def health():
+    """Liveness probe: the process is up and serving"""
+    return {"status": "ok"}
+
+@api_router.get("/ready")
+async def ready():
+    """Readiness probe: reports which subsystems are warm (503 until required ones are)"""
+    report = warmup.readiness()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Per-worker counters and timing summaries"""
+    import tiered_retrieval
+    import circuit_breaker
+    import ocr_pool
+    from model_router import cascade_stats
+    from llm_scheduler import get_scheduler
+    return {
+        **metrics.snapshot(),
+        "retrieval_gates": tiered_retrieval.gate_stats(),
+        "model_cascade": cascade_stats(),
+        "llm_scheduler": get_scheduler().stats(),
+        "circuit_breakers": circuit_breaker.stats(),
+        "ocr_pool": ocr_pool.stats()
+    }
+
 @api_router.get("/auth/doctors")
 async def get_doctors():
     """Mock Doctor List for Frontend Compatibility"""
@@ -166,45 +272,50 @@ async def send_message(req: MessageSendRequest):
     """
     Handles messaging. If sender is patient, triggers AI RAG response.
     """
-    import time
-    
+    conversation = message_store.get(req.patientId, req.doctorId)
+    chat_history = conversation_history(conversation)
+
     # 1. Save User Message
-    user_msg_entry = {
-        "id": f"msg_{len(MESSAGES_DB)+1}",
-        "sender": "patient",
-        "message": req.message,
-        "timestamp": int(time.time() * 1000)
-    }
-    MESSAGES_DB.append(user_msg_entry)
+    conversation.append("patient", req.message)
     
     # 2. Generate AI Response (RAG)
     try:
-        # Convert DB history to ChatFormat for the Engine
-        chat_history = []
-        for m in MESSAGES_DB:
-            role = "user" if m["sender"] == "patient" else "assistant"
-            chat_history.append({"role": role, "content": m["message"]})
-            
-        response_data = get_medical_response(req.message, req.patientId, chat_history)
+        response_data = await get_medical_response(req.message, f"{req.patientId}:{req.doctorId}", chat_history)
         ai_text = response_data.get("answer", "I apologize, I could not generate a response.") if isinstance(response_data, dict) else str(response_data)
     except Exception as e:
         ai_text = f"I apologize, I encountered a technical error: {str(e)}"
 
     # 3. Save AI Message
-    ai_msg_entry = {
-        "id": f"msg_{len(MESSAGES_DB)+1}",
-        "sender": "doctor",
-        "message": ai_text,
-        "timestamp": int(time.time() * 1000) + 100 # slight delay
-    }
-    MESSAGES_DB.append(ai_msg_entry)
+    conversation.append("doctor", ai_text)
 
     return {"success": True, "message": "Sent", "reply": ai_text}
 
+@api_router.post("/messages/send/stream")
+async def send_message_stream(req: MessageSendRequest):
+    """
+    Streaming variant of /messages/send (Server-Sent Events).
+    The AI reply is saved to the conversation once it has streamed in full.
+    """
+    conversation = message_store.get(req.patientId, req.doctorId)
+    chat_history = conversation_history(conversation)
+    conversation.append("patient", req.message)
+
+    async def persist(ai_text):
+        conversation.append("doctor", ai_text)
+
+    return sse_response(
+        stream_medical_response(req.message, f"{req.patientId}:{req.doctorId}", chat_history),
+        on_complete=persist
+    )
+
 @api_router.get("/messages/conversation")
-async def get_conversation(patientId: str, doctorId: str):
-    """Returns full chat history"""
-    return {"success": True, "messages": MESSAGES_DB}
+async def get_conversation(patientId: str, doctorId: str, since: int = None, until: int = None):
+    """
+    Returns retained chat history for one patient/doctor conversation
+    Query params:
+    - since / until: Optional, epoch-millisecond timestamp bounds (inclusive)
+    """
+    return {"success": True, "messages": message_store.range(patientId, doctorId, since, until)}
 
 @api_router.post("/check_emergency")
 async def check_emergency_endpoint(request: TriageRequest):
@@ -212,7 +323,7 @@ async def check_emergency_endpoint(request: TriageRequest):
     Rapid Triage Endpoint (Llama-3.3 + Rules).
     Decides if the patient needs an Ambulance or can proceed to Chat.
     """
-    return analyze_symptom(request.text)
+    return await analyze_symptom(request.text)
 
 
 @api_router.post("/chat_with_guidelines")
@@ -227,7 +338,7 @@ async def chat_with_guidelines(request: ChatRequest):
         
         # 2. Call the reasoning engine with the new message and full context
         # This allows the bot to follow the 'Localization Shortcut' from NHSRC Page 11
-        response = get_medical_response(request.message, request.session_id, chat_history=history_data)
+        response = await get_medical_response(request.message, request.session_id, chat_history=history_data)
         
         return {"reply": response}
     except Exception as e:
@@ -236,6 +347,14 @@ async def chat_with_guidelines(request: ChatRequest):
         # Log the specific error for debugging during your demo
         raise HTTPException(status_code=500, detail=f"RAG Reasoning Error: {str(e)}")
 
+@api_router.post("/chat_with_guidelines/stream")
+async def chat_with_guidelines_stream(request: ChatRequest):
+    """
+    Streaming variant of /chat_with_guidelines (Server-Sent Events)
+    """
+    history_data = [m.model_dump() for m in request.history]
+    return sse_response(stream_medical_response(request.message, request.session_id, chat_history=history_data))
+
 # Router will be mounted at the end
 
 class SummaryRequest(BaseModel):
@@ -250,7 +369,7 @@ async def get_summary(request: Request):
         data = await request.json()
         session_id = data.get("session_id", "default")
         
-        summary_text = generate_summary(session_id)
+        summary_text = await generate_summary(session_id)
         
         # Save text output to temp file
         # Ensure 'backend' directory exists if not already
@@ -279,8 +398,8 @@ async def process_audio(audio: UploadFile = File(...)):
             shutil.copyfileobj(audio.file, buffer)
         
         with open(temp_filename, "rb") as file_obj:
-            transcription = client.audio.transcriptions.create(
-                file=(temp_filename, file_obj),
+            transcription = await transcribe_audio(
+                file=(temp_filename, file_obj.read()),
                 model="whisper-large-v3",
                 response_format="json"
             )
@@ -294,21 +413,23 @@ async def process_audio(audio: UploadFile = File(...)):
         Return ONLY valid JSON:
         {{
             "repaired_text": "...",
-            "english_text": "..."
+            "english_text": "...",
+            "confidence": "number from 0 to 1: how sure you are of the repair"
         }}
         """
 
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile", 
-            messages=[
+        # 8B first pass, 70B only if the repair is unsure or malformed
+        repaired, _ = await cascade_json(
+            "audio_repair",
+            [
                 {"role": "system", "content": "You are a helpful medical data processor. Output JSON only."},
                 {"role": "user", "content": repair_prompt}
             ],
-            response_format={"type": "json_object"},
+            validate=lambda r: isinstance(r.get("repaired_text"), str) and isinstance(r.get("english_text"), str),
             temperature=0
         )
         
-        return json.loads(completion.choices[0].message.content)
+        return repaired
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -316,6 +437,11 @@ async def process_audio(audio: UploadFile = File(...)):
         if os.path.exists(temp_filename):
             os.remove(temp_filename)
 
+# Budget for a background prescription job (OCR + structuring)
+PRESCRIPTION_JOB_TIMEOUT = float(os.getenv("PRESCRIPTION_JOB_TIMEOUT", "120"))
+# Seconds clients are told to wait before retrying when OCR is saturated
+OCR_RETRY_AFTER = 5
+
 @api_router.post("/analyze_prescription")
 async def analyze_prescription_endpoint(
     image: UploadFile = File(...)
@@ -325,20 +451,70 @@ async def analyze_prescription_endpoint(
     Extracts medicines, dosages, and other details
     Does NOT auto-save - user must confirm to save
     """
+    from ocr_pool import OCRQueueFull
     try:
         # Read image bytes
         image_bytes = await image.read()
         
         # Analyze prescription
-        result = analyze_prescription(image_bytes)
+        from prescription_analyzer import analyze_prescription
+        result = await analyze_prescription(image_bytes)
         
         return result
         
+    except OCRQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(OCR_RETRY_AFTER)})
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Prescription analysis error: {str(e)}")
 
+@api_router.post("/analyze_prescription/jobs", status_code=202)
+async def submit_prescription_job(
+    image: UploadFile = File(...)
+):
+    """
+    Submit/poll variant of /analyze_prescription: returns a job id at once,
+    poll GET /analyze_prescription/jobs/{job_id} for the stage and result
+    """
+    import jobs
+    import ocr_pool
+    from prescription_analyzer import analyze_prescription
+
+    # Hold an OCR slot from submission, so an accepted job is never refused later
+    try:
+        slot = ocr_pool.reserve()
+    except ocr_pool.OCRQueueFull:
+        raise HTTPException(status_code=503, detail="OCR queue is full, please retry shortly", headers={"Retry-After": str(OCR_RETRY_AFTER)})
+
+    async def work(progress):
+        with slot:
+            return await analyze_prescription(image_bytes, progress)
+
+    try:
+        image_bytes = await image.read()
+        job_id = await jobs.submit("prescription", work, PRESCRIPTION_JOB_TIMEOUT)
+    except BaseException:
+        slot.release()
+        raise
+    return {
+        "job_id": job_id,
+        "status": jobs.QUEUED,
+        "poll_url": f"/api/analyze_prescription/jobs/{job_id}"
+    }
+
+@api_router.get("/analyze_prescription/jobs/{job_id}")
+async def get_prescription_job(job_id: str):
+    """
+    Status of a prescription job: queued -> running (stage: ocr, structuring) -> done / failed.
+    The analysis is in "result" once status is "done".
+    """
+    import jobs
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
 @api_router.post("/save_prescription_record")
 async def save_prescription_record_endpoint(request: Request):
     """
@@ -386,7 +562,7 @@ async def triage_endpoint(request: Request):
             raise HTTPException(status_code=400, detail="symptom_text or symptoms is required")
         
         # Analyze symptoms using triage service
-        result = analyze_symptom(symptom_text)
+        result = await analyze_symptom(symptom_text)
         
         return result
         
@@ -553,8 +729,6 @@ async def serve_file(filename: str):
 # APPOINTMENT BOOKING ENDPOINTS
 # ============================================
 
-# Import appointment functions
-from firestore_service import save_appointment, get_user_appointments, update_appointment_status
 import time
 
 # Appointment data models
@@ -616,6 +790,7 @@ async def book_appointment(appointment: AppointmentCreate):
         }
         
         # Save to Firestore
+        from firestore_service import save_appointment
         result = save_appointment(appointment_data)
         
         if result.get('success'):
@@ -650,6 +825,7 @@ async def get_appointments(user_id: str, profile_id: str = None):
         if profile_id:
             print(f"   Profile: {profile_id}")
         
+        from firestore_service import get_user_appointments
         result = get_user_appointments(user_id, profile_id)
         
         if result.get('success'):
@@ -688,6 +864,7 @@ async def update_status(appointment_id: str, status_update: AppointmentStatusUpd
     try:
         print(f"🔄 Updating appointment {appointment_id} to {status_update.status}")
         
+        from firestore_service import update_appointment_status
         result = update_appointment_status(appointment_id, status_update.status)
         
         if result.get('success'):
@@ -707,19 +884,18 @@ async def update_status(appointment_id: str, status_update: AppointmentStatusUpd
 # DOCTOR-SIDE ENDPOINTS
 # ============================================
 
-from firestore_service import get_doctor_appointments, get_incoming_records, update_appointment_with_notes, db
-
 @api_router.get("/doctor/uid/{doctor_id}")
 async def get_doctor_uid_endpoint(doctor_id: str):
     """
     Get Firebase UID for a doctor by their doctor_id
     """
     try:
+        from firestore_service import db, rpc_timeout
         if not db:
             return {"success": False, "uid": None}
         
         # Query for doctor by doctor_id
-        docs = db.collection('doctors').where('doctor_id', '==', doctor_id).stream()
+        docs = db.collection('doctors').where('doctor_id', '==', doctor_id).stream(timeout=rpc_timeout())
         
         for doc in docs:
             return {"success": True, "uid": doc.id, "doctor_id": doctor_id}
@@ -737,6 +913,7 @@ async def get_doctor_appts(doctor_id: str):
     try:
         print(f"📋 Fetching appointments for doctor: {doctor_id}")
         
+        from firestore_service import get_doctor_appointments
         result = get_doctor_appointments(doctor_id)
         
         if result.get('success'):
@@ -770,6 +947,7 @@ async def get_incoming_recs():
     try:
         print(f"📋 Fetching incoming records")
         
+        from firestore_service import get_incoming_records
         result = get_incoming_records()
         
         if result.get('success'):
@@ -806,6 +984,7 @@ async def update_doctor_appt(appointment_id: str, update_data: dict):
         status = update_data.get('status', 'completed')
         notes = update_data.get('notes', '')
         
+        from firestore_service import update_appointment_with_notes
         result = update_appointment_with_notes(appointment_id, status, notes)
         
         if result.get('success'):
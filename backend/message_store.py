@@ -0,0 +1,131 @@
+"""
+Conversation Message Store
+In-memory chat storage keyed by (patientId, doctorId).
+Each conversation keeps a bounded window of recent messages, and the number
+of conversations is bounded with LRU eviction, so memory stays flat under load.
+"""
+
+import os
+import time
+import bisect
+import threading
+from collections import OrderedDict
+
+# Retention limits (override via environment)
+MAX_MESSAGES_PER_CONVERSATION = int(os.getenv("MESSAGE_STORE_MAX_PER_CONVERSATION", "200"))
+MAX_CONVERSATIONS = int(os.getenv("MESSAGE_STORE_MAX_CONVERSATIONS", "10000"))
+
+
+class Conversation:
+    """
+    Append-only message window for one patient/doctor pair.
+    Messages live in a list with a moving head index; evicted entries are
+    compacted away in bulk so append stays amortized O(1).
+    """
+
+    __slots__ = ("messages", "timestamps", "head", "next_id", "max_messages")
+
+    def __init__(self, max_messages: int = MAX_MESSAGES_PER_CONVERSATION):
+        self.messages = []
+        self.timestamps = []
+        self.head = 0
+        self.next_id = 1
+        self.max_messages = max_messages
+
+    def __len__(self):
+        return len(self.messages) - self.head
+
+    def append(self, sender: str, message: str, timestamp: int = None) -> dict:
+        """
+        Append a message and return the stored entry.
+        Timestamps are clamped to be non-decreasing so range reads can bisect.
+        """
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            timestamp = self.timestamps[-1]
+
+        entry = {
+            "id": f"msg_{self.next_id}",
+            "sender": sender,
+            "message": message,
+            "timestamp": timestamp
+        }
+        self.next_id += 1
+        self.messages.append(entry)
+        self.timestamps.append(timestamp)
+
+        # Evict the oldest message once over the retention limit
+        if len(self) > self.max_messages:
+            self.head += 1
+            # Compact once the dead prefix is as large as the live window
+            if self.head >= self.max_messages:
+                del self.messages[:self.head]
+                del self.timestamps[:self.head]
+                self.head = 0
+
+        return entry
+
+    def recent(self, limit: int = None) -> list:
+        """Return the last `limit` messages (all retained messages if None)"""
+        start = self.head if limit is None else max(self.head, len(self.messages) - limit)
+        return self.messages[start:]
+
+    def range(self, since: int = None, until: int = None) -> list:
+        """Return messages with since <= timestamp <= until (both optional)"""
+        lo = self.head
+        hi = len(self.messages)
+        if since is not None:
+            lo = bisect.bisect_left(self.timestamps, since, lo, hi)
+        if until is not None:
+            hi = bisect.bisect_right(self.timestamps, until, lo, hi)
+        return self.messages[lo:hi]
+
+
+class ConversationStore:
+    """
+    LRU map of (patientId, doctorId) -> Conversation
+    """
+
+    def __init__(self, max_conversations: int = MAX_CONVERSATIONS,
+                 max_messages: int = MAX_MESSAGES_PER_CONVERSATION):
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._conversations)
+
+    def get(self, patient_id: str, doctor_id: str, create: bool = True):
+        """
+        Look up a conversation, creating it if needed.
+        Returns None when create=False and the conversation doesn't exist.
+        """
+        key = (patient_id, doctor_id)
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is not None:
+                self._conversations.move_to_end(key)
+                return conversation
+            if not create:
+                return None
+
+            conversation = Conversation(self.max_messages)
+            self._conversations[key] = conversation
+            if len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+            return conversation
+
+    def append(self, patient_id: str, doctor_id: str, sender: str, message: str, timestamp: int = None) -> dict:
+        return self.get(patient_id, doctor_id).append(sender, message, timestamp)
+
+    def range(self, patient_id: str, doctor_id: str, since: int = None, until: int = None) -> list:
+        conversation = self.get(patient_id, doctor_id, create=False)
+        if conversation is None:
+            return []
+        return conversation.range(since, until)
+
+
+# Shared store for the API process
+message_store = ConversationStore()
@@ -0,0 +1,48 @@
+"""
+In-Process Metrics
+Lightweight counters and timing summaries for the backend services.
+Exposed via /api/metrics; values are per worker and reset on restart.
+"""
+
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_observations = {}
+
+
+def incr(name: str, value: int = 1):
+    """Increment a counter"""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float):
+    """Record one observation (latency, size, ...) for a summary"""
+    with _lock:
+        stats = _observations.get(name)
+        if stats is None:
+            stats = _observations[name] = {"count": 0, "total": 0.0, "min": value, "max": value, "last": value}
+        stats["count"] += 1
+        stats["total"] += value
+        stats["min"] = min(stats["min"], value)
+        stats["max"] = max(stats["max"], value)
+        stats["last"] = value
+
+
+def get_counter(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> dict:
+    """Return a copy of all counters and summaries"""
+    with _lock:
+        summaries = {}
+        for name, stats in _observations.items():
+            summaries[name] = {
+                **stats,
+                "avg": round(stats["total"] / stats["count"], 4) if stats["count"] else 0.0
+            }
+        return {"counters": dict(_counters), "summaries": summaries}
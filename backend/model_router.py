@@ -0,0 +1,220 @@
+"""
+Model Cascade Router
+Sends the first pass of each LLM route to the small model and escalates to the
+large model only when needed:
+- low confidence (the model's self-reported "confidence" below the route threshold)
+- schema failure (unparseable JSON or missing required fields)
+- a rule match that needs careful wording
+- the small model running past its own time budget
+A model whose circuit breaker is open is skipped rather than tried.
+The model's "confidence" field only drives routing and is removed from results.
+Per-route thresholds are configurable via CASCADE_<ROUTE>_* env vars, and
+escalation rates / latencies are recorded in metrics.
+"""
+
+import os
+import json
+import time
+import asyncio
+
+import circuit_breaker
+import deadline
+import metrics
+from llm_client import chat_completion
+from llm_scheduler import PRIORITY_EMERGENCY, PRIORITY_CHAT
+
+SMALL_MODEL = os.getenv("CASCADE_SMALL_MODEL", "llama-3.1-8b-instant")
+LARGE_MODEL = os.getenv("CASCADE_LARGE_MODEL", "llama-3.3-70b-versatile")
+
+# Route defaults; each key can be overridden with CASCADE_<ROUTE>_<KEY>.
+# Triage's rule-match escalation only applies with TRIAGE_RULES_FAST_PATH=0:
+# with the fast path on, rule-matched inputs get a rules-only verdict first.
+_DEFAULTS = {
+    "triage": {"enabled": True, "min_confidence": 0.85, "escalate_on_rule_match": True},
+    "audio_repair": {"enabled": True, "min_confidence": 0.7, "escalate_on_rule_match": False},
+    "rx_structuring": {"enabled": True, "min_confidence": 0.8, "escalate_on_rule_match": False},
+    # Streamed replies can't be retried, so chat is routed up front by
+    # rule match and message size instead of confidence
+    "chat": {"enabled": True, "max_small_tokens": 120, "escalate_on_rule_match": True},
+}
+
+
+def _env_value(name: str, default):
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    if isinstance(default, bool):
+        return raw == "1"
+    return type(default)(raw)
+
+
+# Scheduler priority of each route's calls
+ROUTE_PRIORITIES = {
+    "triage": PRIORITY_EMERGENCY,
+    "audio_repair": PRIORITY_CHAT,
+    "rx_structuring": PRIORITY_CHAT,
+    "chat": PRIORITY_CHAT,
+}
+
+ROUTES = {
+    route: {key: _env_value(f"CASCADE_{route.upper()}_{key.upper()}", value) for key, value in config.items()}
+    for route, config in _DEFAULTS.items()
+}
+
+
+def _parse_json(content: str):
+    content = (content or "").strip()
+    if "```" in content:
+        content = content.split("```json")[-1] if "```json" in content else content.split("```")[1]
+        content = content.split("```")[0].strip()
+    return json.loads(content)
+
+
+def _confidence(result: dict):
+    try:
+        return float(result.get("confidence"))
+    except (TypeError, ValueError):
+        return None
+
+
+def record_latency(route: str, model: str, seconds: float):
+    tier = "small" if model == SMALL_MODEL else "large"
+    metrics.observe(f"cascade.{route}.{tier}_seconds", seconds)
+
+
+async def _call_json(route: str, model: str, messages: list, **kwargs):
+    started = time.perf_counter()
+    try:
+        completion = await chat_completion(
+            priority=ROUTE_PRIORITIES[route],
+            model=model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            **kwargs
+        )
+        return _parse_json(completion.choices[0].message.content)
+    finally:
+        record_latency(route, model, time.perf_counter() - started)
+
+
+def _escalate(route: str, reason: str):
+    print(f"⬆️ [Cascade] {route}: escalating to {LARGE_MODEL} ({reason})")
+    metrics.incr(f"cascade.{route}.escalations")
+    metrics.incr(f"cascade.{route}.escalations.{reason}")
+
+
+async def _bounded_json(route: str, model: str, messages: list, timeout: float = None, **kwargs):
+    if timeout is None:
+        return await _call_json(route, model, messages, **kwargs)
+    return await asyncio.wait_for(_call_json(route, model, messages, **kwargs), timeout)
+
+
+async def cascade_json(route: str, messages: list, validate, rule_match: bool = False,
+                       small_timeout: float = None, large_timeout: float = None, **kwargs):
+    """
+    JSON completion through the cascade. `validate(result) -> bool` checks the
+    route's schema. Returns (result, model used); the large model's result is
+    returned as-is (its parse errors propagate to the caller).
+    small_timeout bounds the small model's pass (overrunning escalates), and
+    large_timeout the large model's call, counted from its own start so a
+    slow first pass doesn't eat the escalation's time.
+    """
+    config = ROUTES[route]
+    metrics.incr(f"cascade.{route}.requests")
+
+    async def large():
+        result = await _bounded_json(route, LARGE_MODEL, messages, large_timeout, **kwargs)
+        if isinstance(result, dict):
+            result.pop("confidence", None)
+        return result, LARGE_MODEL
+
+    if not config["enabled"]:
+        return await large()
+
+    if rule_match and config["escalate_on_rule_match"]:
+        _escalate(route, "rule_match")
+        return await large()
+
+    if circuit_breaker.is_open(SMALL_MODEL):
+        _escalate(route, "circuit_open")
+        return await large()
+
+    try:
+        result = await _bounded_json(route, SMALL_MODEL, messages, small_timeout, **kwargs)
+        valid = isinstance(result, dict) and validate(result)
+    except asyncio.TimeoutError as e:
+        if isinstance(e, deadline.DeadlineExceeded):
+            raise
+        _escalate(route, "small_timeout")
+        return await large()
+    except Exception as e:
+        print(f"⚠️ [Cascade] {route}: small model failed: {e}")
+        valid = False
+
+    if not valid:
+        _escalate(route, "schema")
+    else:
+        confidence = _confidence(result)
+        if confidence is None or confidence < config["min_confidence"]:
+            _escalate(route, "low_confidence")
+        else:
+            metrics.incr(f"cascade.{route}.small_answers")
+            result.pop("confidence", None)
+            return result, SMALL_MODEL
+
+    return await large()
+
+
+def route_blocked(route: str, rule_match: bool = False) -> bool:
+    """True when every model the route could use has an open circuit"""
+    config = ROUTES[route]
+    models = [LARGE_MODEL]
+    if config["enabled"] and not (rule_match and config["escalate_on_rule_match"]):
+        models.append(SMALL_MODEL)
+    return all(circuit_breaker.is_open(model) for model in models)
+
+
+def choose_chat_model(message: str, rule_match: bool = False) -> str:
+    """Up-front routing for streamed chat (no second pass is possible)"""
+    config = ROUTES["chat"]
+    metrics.incr("cascade.chat.requests")
+
+    if not config["enabled"]:
+        return LARGE_MODEL
+    if rule_match and config["escalate_on_rule_match"]:
+        _escalate("chat", "rule_match")
+        return LARGE_MODEL
+    if len(message) // 4 > config["max_small_tokens"]:
+        _escalate("chat", "long_message")
+        return LARGE_MODEL
+    if circuit_breaker.is_open(SMALL_MODEL):
+        _escalate("chat", "circuit_open")
+        return LARGE_MODEL
+
+    metrics.incr("cascade.chat.small_answers")
+    return SMALL_MODEL
+
+
+def cascade_stats() -> dict:
+    """
+    Per-route escalation rate and latency savings for /api/metrics.
+    Savings estimate: small-model answers x (mean large latency - mean small latency).
+    """
+    snapshot = metrics.snapshot()
+    counters, summaries = snapshot["counters"], snapshot["summaries"]
+    stats = {}
+    for route in ROUTES:
+        requests = counters.get(f"cascade.{route}.requests", 0)
+        escalations = counters.get(f"cascade.{route}.escalations", 0)
+        small_answers = counters.get(f"cascade.{route}.small_answers", 0)
+        small = summaries.get(f"cascade.{route}.small_seconds", {}).get("avg")
+        large = summaries.get(f"cascade.{route}.large_seconds", {}).get("avg")
+        stats[route] = {
+            "requests": requests,
+            "escalation_rate": round(escalations / requests, 4) if requests else None,
+            "small_answers": small_answers,
+            "avg_small_seconds": small,
+            "avg_large_seconds": large,
+            "estimated_seconds_saved": round(small_answers * (large - small), 3) if small is not None and large is not None else None
+        }
+    return stats
@@ -0,0 +1,192 @@
+"""
+OCR Process Pool
+Image work for prescriptions (normalization, Pillow preprocessing and the
+tesseract subprocess) runs in a small ProcessPoolExecutor so a large photo
+never holds the event loop or the GIL.
+Workers are spawned (not forked) because the server process already runs
+threads, and this module stays light so each worker only imports Pillow and
+pytesseract.
+Admission is bounded: once OCR_QUEUE_MAX images are queued or running in this
+uvicorn worker, new ones are refused with OCRQueueFull. A background job
+reserves its slot when it is submitted, so jobs accepted at once can't
+overrun the queue later.
+"""
+
+import os
+import time
+import asyncio
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import deadline
+import image_normalize
+import metrics
+
+# Configure Tesseract path (Windows)
+# User will need to install Tesseract separately
+# Download from: https://github.com/UB-Mannheim/tesseract/wiki
+# Default installation path:
+TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(2, os.cpu_count() or 1))))
+# Images queued or running per uvicorn worker before new ones are refused
+OCR_QUEUE_MAX = int(os.getenv("OCR_QUEUE_MAX", "8"))
+
+
+class OCRQueueFull(RuntimeError):
+    """Raised when OCR_QUEUE_MAX images are already waiting (backpressure)"""
+
+
+def tesseract_available() -> bool:
+    return os.path.exists(TESSERACT_PATH)
+
+
+def preprocess_image(image):
+    """
+    Preprocess image for better OCR accuracy
+    (expects a normalized image: oriented, grayscale, within the pixel budget)
+    """
+    from PIL import ImageEnhance, ImageFilter
+
+    # Convert to grayscale
+    image = image.convert('L')
+
+    # Increase contrast
+    enhancer = ImageEnhance.Contrast(image)
+    image = enhancer.enhance(2.0)
+
+    # Sharpen
+    image = image.filter(ImageFilter.SHARPEN)
+
+    return image
+
+
+def run_tesseract(image_bytes):
+    """
+    Blocking Tesseract pass (Pillow preprocessing + tesseract subprocess).
+    Runs inside a pool worker process.
+    """
+    import pytesseract
+
+    if tesseract_available():
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
+
+    # Load, orient, grayscale and downsample to the OCR pixel budget
+    image = image_normalize.normalize_image(image_bytes)
+
+    # Preprocess
+    processed_image = preprocess_image(image)
+
+    # Extract text with Tesseract
+    return pytesseract.image_to_string(processed_image)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = 0
+# Reservation held by the current task, if any (its image already counts in _pending)
+_held = contextvars.ContextVar("ocr_reservation", default=None)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Created on first OCR so startup never pays for spawning workers
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(OCR_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            print(f"🧵 [OCR Pool] Started {OCR_WORKERS} OCR worker process(es)")
+        return _pool
+
+
+def _discard_pool(pool):
+    # A worker died (e.g. OOM on a huge image); the next call gets a fresh pool
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def saturated() -> bool:
+    return _pending >= OCR_QUEUE_MAX
+
+
+def _admit():
+    global _pending
+    if saturated():
+        metrics.incr("ocr.rejected")
+        raise OCRQueueFull(f"OCR queue full ({_pending} images waiting)")
+    _pending += 1
+
+
+class Reservation:
+    """
+    A queue slot claimed ahead of the OCR that will use it. OCR run inside
+    `with reservation:` uses the slot instead of being admitted again; the
+    slot is freed on exit, or by release() if the work never runs.
+    """
+
+    def __init__(self):
+        _admit()
+        self.released = False
+
+    def release(self):
+        global _pending
+        if not self.released:
+            self.released = True
+            _pending -= 1
+
+    def __enter__(self):
+        self._token = _held.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _held.reset(self._token)
+        self.release()
+
+
+def reserve() -> Reservation:
+    """Claim a slot now for OCR that runs later; raises OCRQueueFull when saturated"""
+    return Reservation()
+
+
+async def _run(fn, image_bytes: bytes, what: str, metric: str):
+    global _pending
+    reserved = _held.get() is not None
+    if not reserved:
+        _admit()
+    started = time.perf_counter()
+    pool = _get_pool()
+    try:
+        future = asyncio.get_running_loop().run_in_executor(pool, fn, image_bytes)
+        result = await deadline.bound(future, what)
+        metrics.observe(metric, time.perf_counter() - started)
+        return result
+    except BrokenProcessPool:
+        metrics.incr("ocr.pool_restarts")
+        _discard_pool(pool)
+        raise
+    finally:
+        if not reserved:
+            _pending -= 1
+
+
+async def run_ocr(image_bytes: bytes) -> str:
+    """
+    OCR one image in the process pool. Raises OCRQueueFull when the queue is
+    at OCR_QUEUE_MAX, and deadline.DeadlineExceeded if the request deadline
+    passes first (the worker finishes the image regardless).
+    """
+    return await _run(run_tesseract, image_bytes, "OCR", "ocr.seconds")
+
+
+async def normalize_for_vision(image_bytes: bytes) -> bytes:
+    """Compact grayscale JPEG for the cloud vision upload, built in the pool"""
+    return await _run(image_normalize.normalize_for_vision, image_bytes, "Image normalization", "ocr.normalize_seconds")
+
+
+def stats() -> dict:
+    return {"workers": OCR_WORKERS, "pending": _pending, "queue_max": OCR_QUEUE_MAX, "started": _pool is not None}
@@ -4,98 +4,64 @@ Uses Tesseract OCR to extract text from prescription images
 Then uses Groq LLM to structure the data
 """
 
-import os
 import json
-from groq import Groq
-from PIL import Image
-import pytesseract
-import io
-import re
-from dotenv import load_dotenv
+from llm_client import chat_completion
+from model_router import cascade_json
+import deadline
+from ocr_pool import OCRQueueFull, normalize_for_vision, run_ocr, tesseract_available
 
-# Load environment variables
-current_dir = os.path.dirname(os.path.abspath(__file__))
-env_path = os.path.join(current_dir, ".env")
-load_dotenv(env_path)
-
-# Initialize Groq client
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    print("⚠️ [Rx Analyzer] GROQ_API_KEY not found in environment")
-    client = None
-else:
-    client = Groq(api_key=GROQ_API_KEY)
-
-# Configure Tesseract path (Windows)
-# User will need to install Tesseract separately
-# Download from: https://github.com/UB-Mannheim/tesseract/wiki
-# Default installation path:
-TESSERACT_PATH = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-
-if os.path.exists(TESSERACT_PATH):
-    pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
+if tesseract_available():
     print("✅ [Rx Analyzer] Tesseract found")
 else:
     print("⚠️ [Rx Analyzer] Tesseract not found at default path")
     print("   Please install from: https://github.com/UB-Mannheim/tesseract/wiki")
 
 
-def preprocess_image(image):
-    """
-    Preprocess image for better OCR accuracy
-    """
-    from PIL import ImageEnhance, ImageFilter
-    
-    # Convert to grayscale
-    image = image.convert('L')
-    
-    # Increase contrast
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(2.0)
-    
-    # Sharpen
-    image = image.filter(ImageFilter.SHARPEN)
-    
-    return image
-
-
-def extract_text_from_image(image_bytes):
+async def extract_text_from_image(image_bytes):
     """
     Extract text from image using Tesseract OCR (local) or Groq Vision API (cloud)
     """
     # Check if Tesseract is available (for local development)
-    tesseract_available = os.path.exists(TESSERACT_PATH)
+    use_tesseract = tesseract_available()
     
-    if tesseract_available:
+    if use_tesseract:
         try:
-            # Load image
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Preprocess
-            processed_image = preprocess_image(image)
-            
-            # Extract text with Tesseract
-            raw_text = pytesseract.image_to_string(processed_image)
+            # OCR runs in the process pool so the event loop stays free
+            raw_text = await run_ocr(image_bytes)
             
             print(f"📄 [Rx Analyzer] Tesseract extracted {len(raw_text)} characters")
             return raw_text
             
+        except (OCRQueueFull, deadline.DeadlineExceeded):
+            # Backpressure / out of time: surface it rather than piling onto the cloud path
+            raise
         except Exception as e:
             print(f"⚠️ [Rx Analyzer] Tesseract failed: {e}, falling back to cloud OCR")
-            tesseract_available = False
+            use_tesseract = False
     
     # Fallback to cloud-based vision (for production/Render)
-    if not tesseract_available:
+    if not use_tesseract:
         try:
             import base64
             
+            # Upload an oriented, downsampled grayscale JPEG, not the raw photo
+            try:
+                upload_bytes = await normalize_for_vision(image_bytes)
+                print(f"🗜️ [Rx Analyzer] Vision upload normalized: {len(image_bytes)} -> {len(upload_bytes)} bytes")
+            except (OCRQueueFull, deadline.DeadlineExceeded):
+                raise
+            except Exception as e:
+                # e.g. a format Pillow can't decode: send it as-is
+                print(f"⚠️ [Rx Analyzer] Image normalization failed: {e}, uploading original")
+                upload_bytes = image_bytes
+            
             # Convert image to base64
-            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+            image_base64 = base64.b64encode(upload_bytes).decode('utf-8')
             
             # Use Groq's vision model to extract text
             print("☁️ [Rx Analyzer] Using cloud vision API...")
             
-            completion = client.chat.completions.create(
+            completion = await chat_completion(
                 model="llava-v1.5-7b-4096-preview",
                 messages=[
                     {
@@ -122,20 +88,25 @@ def extract_text_from_image(image_bytes):
             print(f"📄 [Rx Analyzer] Cloud vision extracted {len(raw_text)} characters")
             return raw_text
             
+        except (OCRQueueFull, deadline.DeadlineExceeded):
+            raise
         except Exception as e:
             print(f"❌ [Rx Analyzer] Cloud OCR Error: {e}")
             raise Exception(f"Failed to extract text from image: {str(e)}")
 
 
-def analyze_prescription(image_bytes):
+async def analyze_prescription(image_bytes, progress=None):
     """
     Complete prescription analysis pipeline
     1. OCR extraction
     2. LLM structuring
+    progress(stage), if given, is called as each step starts (job API).
     """
+    progress = progress or (lambda stage: None)
     
     # Step 1: Extract text with OCR
-    raw_text = extract_text_from_image(image_bytes)
+    progress("ocr")
+    raw_text = await extract_text_from_image(image_bytes)
     
     if not raw_text or len(raw_text.strip()) < 10:
         return {
@@ -146,6 +117,7 @@ def analyze_prescription(image_bytes):
     print(f"🔍 [Rx Analyzer] Raw OCR text:\n{raw_text[:200]}...")
     
     # Step 2: Use LLM to structure the data
+    progress("structuring")
     system_prompt = """You are a medical prescription analyzer. Extract structured information from OCR text.
 
 Your response MUST be valid JSON with this structure:
@@ -173,7 +145,8 @@ Your response MUST be valid JSON with this structure:
             "route": "route of administration (e.g., Oral, IV)"
         }
     ],
-    "notes": "any additional notes or null"
+    "notes": "any additional notes or null",
+    "confidence": "number from 0 to 1: how legible and complete the extraction is"
 }
 
 Common medical abbreviations:
@@ -195,26 +168,18 @@ Extract ALL medicines mentioned. If information is unclear or missing, use null.
 Return structured JSON."""
 
     try:
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
+        # 8B first pass, 70B only if the extraction is unsure or malformed
+        result, _ = await cascade_json(
+            "rx_structuring",
+            [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
+            validate=lambda r: isinstance(r.get("medicines"), list),
             temperature=0.1,
             max_tokens=2000
         )
         
-        response_text = completion.choices[0].message.content.strip()
-        
-        # Extract JSON from response
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0].strip()
-        
-        result = json.loads(response_text)
-        
         # Add raw OCR text to result
         result["raw_ocr_text"] = raw_text
         
@@ -223,7 +188,6 @@ Return structured JSON."""
         
     except json.JSONDecodeError as e:
         print(f"❌ [Rx Analyzer] JSON parse error: {e}")
-        print(f"Raw response: {response_text}")
         return {
             "success": False,
             "error": "Failed to parse prescription data",
@@ -0,0 +1,315 @@
+"""
+Shared Resource Registry
+One lazily-created instance per worker of each heavy client (Groq, ChromaDB,
+the embedding model), shared by every service module. Connection pool limits
+live here too.
+"""
+
+import os
+import json
+import time
+import hashlib
+import asyncio
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+current_dir = os.path.dirname(os.path.abspath(__file__))
+env_path = os.path.join(current_dir, ".env")
+load_dotenv(env_path)
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# Groq HTTP connection pool limits
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "32"))
+GROQ_MAX_KEEPALIVE = int(os.getenv("GROQ_MAX_KEEPALIVE", "16"))
+
+# Persistent on-disk cache of query embeddings, shared by all workers
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") == "1"
+
+# After the embedding model fails to load (e.g. it can't be downloaded offline),
+# embedding is skipped for a backoff that doubles per failure up to this cap
+EMBEDDER_RETRY_SECONDS = float(os.getenv("EMBEDDER_RETRY_SECONDS", "30"))
+EMBEDDER_RETRY_MAX_SECONDS = float(os.getenv("EMBEDDER_RETRY_MAX_SECONDS", "600"))
+
+# Medical knowledge base (built by setup_tiered_db.py)
+CHROMA_DB_PATH = os.path.join(current_dir, "medical_db_v2")
+GOLDEN_COLLECTION = "golden_collection"
+REFERENCE_COLLECTION = "reference_collection"
+# A collection that failed to open (missing, or a transient Chroma error) is retried after this long
+COLLECTION_RETRY_SECONDS = float(os.getenv("COLLECTION_RETRY_SECONDS", "30"))
+
+_lock = threading.RLock()
+_groq = None
+_sync_groq = None
+_embedder = None
+_embedder_failures = 0
+_embedder_retry_at = 0.0
+_chroma_clients = {}
+_collections = {}
+_collection_failures = {}  # (path, name) -> monotonic time of the last failed open
+_stamps = {}  # path -> ((mtime_ns, size) of the stamp or None if unstamped, version)
+_opened_versions = {}  # path -> knowledge base version the open handles belong to
+
+
+def get_groq():
+    """Shared AsyncGroq client (None if GROQ_API_KEY is missing)"""
+    global _groq
+    if _groq is None and GROQ_API_KEY:
+        with _lock:
+            if _groq is None:
+                import httpx
+                from groq import AsyncGroq, DefaultAsyncHttpxClient
+
+                _groq = AsyncGroq(
+                    api_key=GROQ_API_KEY,
+                    # Retries (and retry-after) are handled by llm_scheduler
+                    max_retries=0,
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=GROQ_MAX_CONNECTIONS,
+                            max_keepalive_connections=GROQ_MAX_KEEPALIVE
+                        )
+                    )
+                )
+                print("✅ [Resources] Async Groq client initialized")
+    return _groq
+
+
+def get_sync_groq():
+    """Shared synchronous Groq client for scripts and sync-only code paths"""
+    global _sync_groq
+    if _sync_groq is None and GROQ_API_KEY:
+        with _lock:
+            if _sync_groq is None:
+                from groq import Groq
+                _sync_groq = Groq(api_key=GROQ_API_KEY)
+    return _sync_groq
+
+
+def get_embedder():
+    """
+    Shared query/document embedding function (Chroma's default ONNX MiniLM).
+    Every collection handle uses this instance so the model loads once per worker.
+    Wrapped in the persistent embedding cache unless EMBEDDING_CACHE=0.
+    """
+    global _embedder
+    if _embedder is None:
+        with _lock:
+            if _embedder is None:
+                from chromadb.utils import embedding_functions
+                _embedder = embedding_functions.DefaultEmbeddingFunction()
+                if EMBEDDING_CACHE:
+                    from embedding_cache import CachedEmbeddingFunction
+                    _embedder = CachedEmbeddingFunction(_embedder)
+    return _embedder
+
+
+class EmbedderUnavailable(RuntimeError):
+    """Raised by embed() while a failed embedding model load is backing off"""
+
+
+def embedder_available() -> bool:
+    """False while a failed embedding model load is backing off"""
+    return time.monotonic() >= _embedder_retry_at
+
+
+def embed(texts: list):
+    """
+    Embed texts with the shared embedding function. After a failure, calls
+    raise EmbedderUnavailable without touching the model until the backoff ends.
+    """
+    global _embedder_failures, _embedder_retry_at
+    if not embedder_available():
+        raise EmbedderUnavailable("embedding model unavailable (backing off after a failed load)")
+    try:
+        vectors = get_embedder()(texts)
+    except Exception as e:
+        with _lock:
+            backoff = min(EMBEDDER_RETRY_MAX_SECONDS, EMBEDDER_RETRY_SECONDS * 2 ** _embedder_failures)
+            _embedder_failures += 1
+            _embedder_retry_at = time.monotonic() + backoff
+        print(f"⚠️ [Resources] Embedding model unavailable, next attempt in {backoff:.0f}s: {e}")
+        raise
+    _embedder_failures = 0
+    return vectors
+
+
+def get_chroma(path: str = CHROMA_DB_PATH):
+    """Shared chromadb.PersistentClient for a directory"""
+    client = _chroma_clients.get(path)
+    if client is None:
+        with _lock:
+            client = _chroma_clients.get(path)
+            if client is None:
+                import chromadb
+                client = chromadb.PersistentClient(path=path)
+                _chroma_clients[path] = client
+    return client
+
+
+def _content_fingerprint(db_path: str) -> str:
+    # Chunk count and highest sequence id, read once per process: the SQLite
+    # file's mtime/size also change on ordinary reads (WAL checkpoints, Chroma's
+    # own bookkeeping), so they can't stand in for a content version
+    try:
+        conn = sqlite3.connect(f"file:{os.path.join(db_path, 'chroma.sqlite3')}?mode=ro", uri=True)
+        try:
+            count, max_seq = conn.execute("SELECT COUNT(*), MAX(seq_id) FROM embeddings").fetchone()
+        finally:
+            conn.close()
+        return f"unstamped:{count}:{max_seq}"
+    except sqlite3.Error:
+        return "missing"
+
+
+def kb_version(db_path: str) -> str:
+    """
+    Version of a Chroma persistent directory. Uses the kb_version.json stamp
+    written by setup_tiered_db.py (re-read only when the file changes): its
+    content version plus the collection ids, which every --rebuild changes. An
+    unstamped database gets a fingerprint of its contents taken at first use;
+    stamp it (setup_tiered_db.py --stamp) for changes to be picked up.
+    """
+    stamp_path = os.path.join(db_path, "kb_version.json")
+    try:
+        stat = os.stat(stamp_path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = _stamps.get(db_path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(stamp_path, "r", encoding="utf-8") as f:
+            stamp = json.load(f)
+        version = f"stamp:{stamp['version']}"
+        if stamp.get("collection_ids"):
+            ids = json.dumps(stamp["collection_ids"], sort_keys=True)
+            version += f":{hashlib.sha1(ids.encode('utf-8')).hexdigest()[:8]}"
+        _stamps[db_path] = (key, version)
+        return version
+    except (OSError, ValueError, KeyError):
+        pass
+
+    cached = _stamps.get(db_path)
+    if cached is not None and cached[0] is None:
+        return cached[1]
+    version = _content_fingerprint(db_path)
+    if version != "missing":
+        _stamps[db_path] = (None, version)
+    return version
+
+
+def _check_kb_version(path: str):
+    # One stat of the stamp file; the same version the retrieval caches key on
+    version = kb_version(path)
+    if _opened_versions.get(path) == version:
+        return
+    with _lock:
+        opened = _opened_versions.get(path)
+        _opened_versions[path] = version
+        if opened is None or opened == version:
+            return
+        print(f"🔄 [Resources] Knowledge base at {path} changed ({opened} -> {version}), re-opening collections")
+        # A rebuild recreates collections under new ids, and Chroma caches one
+        # system per directory: drop it along with every handle opened through it
+        from chromadb.api.shared_system_client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+        _chroma_clients.clear()
+        _collections.clear()
+        _collection_failures.clear()
+
+
+def _retry_pending(key) -> bool:
+    failed_at = _collection_failures.get(key)
+    return failed_at is not None and time.monotonic() - failed_at < COLLECTION_RETRY_SECONDS
+
+
+def get_collection(name: str = REFERENCE_COLLECTION, path: str = CHROMA_DB_PATH):
+    """
+    Shared collection handle. Returns None if the collection can't be opened
+    (e.g. it doesn't exist yet); the open is retried after COLLECTION_RETRY_SECONDS.
+    The first open blocks: async code should use get_collection_async().
+    Handles are re-opened once the knowledge base version changes (e.g. after
+    setup_tiered_db.py --rebuild).
+    """
+    _check_kb_version(path)
+    key = (path, name)
+    collection = _collections.get(key)
+    if collection is not None:
+        return collection
+    with _lock:
+        collection = _collections.get(key)
+        if collection is not None or _retry_pending(key):
+            return collection
+        try:
+            collection = get_chroma(path).get_collection(
+                name=name,
+                embedding_function=get_embedder()
+            )
+        except Exception as e:
+            print(f"⚠️ [Resources] Collection '{name}' unavailable, retrying in {COLLECTION_RETRY_SECONDS:.0f}s: {e}")
+            _collection_failures[key] = time.monotonic()
+            return None
+        _collection_failures.pop(key, None)
+        _collections[key] = collection
+        print(f"✅ [Resources] Connected to collection '{name}'")
+    return collection
+
+
+async def get_collection_async(name: str = REFERENCE_COLLECTION, path: str = CHROMA_DB_PATH):
+    """get_collection() for async code: the first open (client + collection) runs in a worker thread"""
+    _check_kb_version(path)
+    key = (path, name)
+    collection = _collections.get(key)
+    if collection is not None or _retry_pending(key):
+        return collection
+    return await asyncio.to_thread(get_collection, name, path)
+
+
+def drop_collection(name: str, path: str = CHROMA_DB_PATH):
+    """Forget a handle whose collection no longer exists (e.g. recreated by a rebuild)"""
+    with _lock:
+        _collections.pop((path, name), None)
+
+
+def reset():
+    """Drop cached collection handles so they are re-opened on next use"""
+    with _lock:
+        _collections.clear()
+        _collection_failures.clear()
+
+
+def warm_embedder():
+    """Load the ONNX embedding model by embedding a synthetic string"""
+    embed(["warm-up query"])
+
+
+def warm_collections(path: str = CHROMA_DB_PATH) -> int:
+    """
+    Open every collection in a Chroma directory and run a synthetic query,
+    paging in its HNSW segments. Returns the number of collections warmed.
+    """
+    if not embedder_available():
+        raise EmbedderUnavailable("embedding model unavailable, synthetic queries skipped")
+    warmed = 0
+    for info in get_chroma(path).list_collections():
+        name = info if isinstance(info, str) else info.name
+        collection = get_collection(name, path)
+        if collection is not None and collection.count() > 0:
+            collection.query(query_texts=["chest pain and fever"], n_results=1)
+            warmed += 1
+    return warmed
+
+
+def status() -> dict:
+    """Which shared resources have been created in this worker"""
+    return {
+        "groq": _groq is not None,
+        "embedder": _embedder is not None,
+        "embedder_available": embedder_available(),
+        "chroma_clients": list(_chroma_clients.keys()),
+        "collections": {
+            **{name: False for (_, name) in _collection_failures},
+            **{name: True for (_, name) in _collections}
+        }
+    }
@@ -0,0 +1,108 @@
+"""
+Retrieval Memoization
+Bounded, size-aware caches in front of Chroma guideline queries and RAG summaries.
+Keys include the query text, n_results and the knowledge-base version, and
+both caches are cleared as soon as the knowledge base version changes.
+Concurrent misses for the same key are coalesced into one upstream call.
+"""
+
+import os
+import asyncio
+
+import deadline
+import metrics
+from cache import TTLCache
+from resources import drop_collection, embed, get_collection, kb_version
+from singleflight import SingleFlight
+
+RETRIEVAL_CACHE_BYTES = int(os.getenv("RETRIEVAL_CACHE_BYTES", str(8 * 1024 * 1024)))
+RAG_SUMMARY_CACHE_BYTES = int(os.getenv("RAG_SUMMARY_CACHE_BYTES", str(2 * 1024 * 1024)))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "21600"))
+
+_query_cache = TTLCache(maxsize=5000, ttl=RETRIEVAL_CACHE_TTL, max_bytes=RETRIEVAL_CACHE_BYTES)
+_summary_cache = TTLCache(maxsize=5000, ttl=RETRIEVAL_CACHE_TTL, max_bytes=RAG_SUMMARY_CACHE_BYTES)
+
+_query_flight = SingleFlight("retrieval")
+_summary_flight = SingleFlight("rag_summary")
+
+_last_version = {}
+
+
+def _check_version(db_path: str) -> str:
+    version = kb_version(db_path)
+    previous = _last_version.get(db_path)
+    if previous is not None and previous != version:
+        print(f"🔄 [Retrieval Cache] Knowledge base changed at {db_path}, invalidating caches")
+        _query_cache.clear()
+        _summary_cache.clear()
+        metrics.incr("retrieval.cache.invalidations")
+    _last_version[db_path] = version
+    return version
+
+
+async def query(collection, db_path: str, query_text: str, n_results: int) -> dict:
+    """
+    Memoized collection.query(query_texts=[query_text], n_results=n_results).
+    The query is embedded through resources.embed(), so it fails fast while
+    a failed embedding model load is backing off.
+    The sync Chroma call runs in a worker thread on a miss; the wait for it
+    is bounded by the request deadline. The thread can't be cancelled, so it
+    caches its own result: a query abandoned by every caller still serves
+    the next request.
+    """
+    version = _check_version(db_path)
+    key = (collection.name, version, query_text, n_results)
+
+    results = _query_cache.get(key)
+    if results is not None:
+        metrics.incr("retrieval.cache.query_hits")
+        return results
+
+    metrics.incr("retrieval.cache.query_misses")
+
+    def embed_and_query():
+        from chromadb.errors import NotFoundError
+
+        embeddings = embed([query_text])
+        try:
+            results = collection.query(query_embeddings=embeddings, n_results=n_results)
+        except NotFoundError:
+            # Recreated since this handle was opened: re-open it once by name
+            drop_collection(collection.name, db_path)
+            fresh = get_collection(collection.name, db_path)
+            if fresh is None:
+                raise
+            results = fresh.query(query_embeddings=embeddings, n_results=n_results)
+        # Only the fields callers read; embeddings/uris are dropped to keep entries small
+        results = {k: results.get(k) for k in ("ids", "documents", "metadatas", "distances")}
+        _query_cache.set(key, results)
+        return results
+
+    async def run_query():
+        return await asyncio.to_thread(embed_and_query)
+
+    return await deadline.bound(_query_flight.do(key, run_query), f"{collection.name} query")
+
+
+async def summary(db_path: str, query_text: str, n_results: int, compute):
+    """
+    Memoized RAG summary. `compute` is an async callable producing the summary;
+    None results (failures) are not cached.
+    """
+    version = _check_version(db_path)
+    key = (version, query_text, n_results)
+
+    cached = _summary_cache.get(key)
+    if cached is not None:
+        metrics.incr("retrieval.cache.summary_hits")
+        return cached
+
+    metrics.incr("retrieval.cache.summary_misses")
+
+    async def run_summary():
+        result = await compute()
+        if result is not None:
+            _summary_cache.set(key, result)
+        return result
+
+    return await _summary_flight.do(key, run_summary)
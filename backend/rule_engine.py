@@ -0,0 +1,139 @@
+"""
+Emergency Rule Engine
+Compiles emergency_rules.json into an immutable snapshot (rules, pre-rendered
+prompt block, keyword matcher, symptom segmenter, version hash) and hot-swaps
+it when the file changes on disk. Readers grab `engine.current()` once per request and never
+see a half-built version.
+get_engine() returns the shared engine for emergency_rules.json, so triage and
+chat routing use one matcher without importing each other.
+"""
+
+import os
+import json
+import hashlib
+import threading
+import time
+
+from keyword_matcher import build_rule_matcher
+from symptom_lexicon import build_segmenter
+from cluster_index import catalog_terms
+
+RULES_RELOAD_INTERVAL = float(os.getenv("RULES_RELOAD_INTERVAL", "2"))
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+RULES_PATH = os.path.join(current_dir, "emergency_rules.json")
+
+# High-risk keywords that force an emergency verdict regardless of LLM response
+CRITICAL_KEYWORDS = [
+    "chest pain", "heart attack", "can't breathe", "breathless", 
+    "stroke", "numbness", "unconscious", "head injury", "bleeding",
+    "suicide", "poison", "overdose", "vision loss", "seizure", 
+    "slurred speech", "paralysis", "severe pain", "crushing"
+]
+
+
+class CompiledRules:
+    """Immutable, fully-built view of one version of the rules file"""
+
+    __slots__ = ("rules", "prompt_block", "matcher", "segmenter", "version")
+
+    def __init__(self, rules: list, critical_keywords: list, version: str):
+        self.rules = rules
+        self.prompt_block = json.dumps(rules)
+        self.matcher = build_rule_matcher(critical_keywords, rules)
+        self.segmenter = build_segmenter(rules, catalog_terms())
+        self.version = version
+
+
+class RuleEngine:
+
+    def __init__(self, path: str, critical_keywords: list):
+        self.path = path
+        self.critical_keywords = critical_keywords
+        self._compiled = CompiledRules([], critical_keywords, "empty")
+        self._mtime = None
+        self._listeners = []
+        self._watcher = None
+        self._lock = threading.Lock()
+
+    def current(self) -> CompiledRules:
+        return self._compiled
+
+    def on_reload(self, callback):
+        """Register callback(compiled) to run after a new version goes live"""
+        self._listeners.append(callback)
+
+    def reload(self) -> bool:
+        """
+        Re-read and compile the rules file. The live snapshot is only replaced
+        once the new one is fully built; a broken file keeps the previous version.
+        Returns True if a new version was swapped in.
+        """
+        with self._lock:
+            try:
+                if not os.path.exists(self.path):
+                    print("⚠️ [Rules] emergency_rules.json not found.")
+                    return False
+
+                mtime = os.stat(self.path).st_mtime_ns
+                with open(self.path, "rb") as f:
+                    raw = f.read()
+                self._mtime = mtime
+
+                version = hashlib.sha256(raw).hexdigest()[:12]
+                if version == self._compiled.version:
+                    return False
+
+                rules = json.loads(raw)
+                compiled = CompiledRules(rules, self.critical_keywords, version)
+            except Exception as e:
+                print(f"❌ [Rules] Error loading rules, keeping version {self._compiled.version}: {e}")
+                return False
+
+            self._compiled = compiled  # atomic reference swap
+            print(f"✅ [Rules] Loaded {len(rules)} condition categories (version {version}, {compiled.matcher.pattern_count} patterns)")
+
+        for callback in self._listeners:
+            try:
+                callback(compiled)
+            except Exception as e:
+                print(f"⚠️ [Rules] Reload listener failed: {e}")
+        return True
+
+    def _changed_on_disk(self) -> bool:
+        try:
+            return os.stat(self.path).st_mtime_ns != self._mtime
+        except OSError:
+            return False
+
+    def _watch(self):
+        while True:
+            time.sleep(RULES_RELOAD_INTERVAL)
+            if self._changed_on_disk():
+                self.reload()
+
+    def start_watching(self):
+        """Poll the rules file in a daemon thread and reload on change"""
+        if self._watcher is None and RULES_RELOAD_INTERVAL > 0:
+            self._watcher = threading.Thread(target=self._watch, name="rules-watcher", daemon=True)
+            self._watcher.start()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> RuleEngine:
+    """
+    Shared engine for emergency_rules.json and CRITICAL_KEYWORDS, loaded and
+    watched for changes on first use
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = RuleEngine(RULES_PATH, CRITICAL_KEYWORDS)
+                engine.reload()
+                engine.start_watching()
+                _engine = engine
+    return _engine
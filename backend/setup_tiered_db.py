@@ -1,28 +1,119 @@
 import chromadb
+import hashlib
 import json
 import os
-import shutil
+import sys
+import time
 
 # 1. Determine Paths
 current_dir = os.path.dirname(os.path.abspath(__file__))
 db_path = os.path.join(current_dir, "medical_db_v2")
 json_path = os.path.join(current_dir, "processed_nhsrc.json")
 
-# RESET DB for fresh start (Safety to remove old schema)
-if os.path.exists(db_path):
-    print(f"🗑️ Clearing old database at {db_path}...")
-    shutil.rmtree(db_path)
+# Version stamp read by the runtime caches and collection handles (see resources.kb_version)
+VERSION_FILE = "kb_version.json"
 
-# Initialize Client
-db_client = chromadb.PersistentClient(path=db_path)
+# Chunks embedded per upsert call; the ONNX embedder is fastest around 32-128
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
 
-# 2. Setup GATE 1: The Golden Gate (Precision)
-golden_coll = db_client.get_or_create_collection(name="golden_collection")
 
-# 3. Setup GATE 2: The Reference Gate (Intelligence)
-reference_coll = db_client.get_or_create_collection(name="reference_collection")
+def content_hash(document: str, metadata: dict) -> str:
+    """Stable hash of a chunk's text and metadata"""
+    payload = json.dumps({"document": document, "metadata": metadata}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
-def setup():
+
+def build_items(data: list):
+    """Split processed items into {id: (document, metadata)} for each gate"""
+    reference, golden = {}, {}
+    for item in data:
+        # Reference Data
+        reference[item['id']] = (item['content'], item['metadata'])
+
+        # Golden Data
+        if item['metadata'].get('is_golden'):
+            golden_rule = item['metadata'].get('golden_rule_content')
+            if golden_rule:
+                golden[f"{item['id']}_GOLD"] = (golden_rule, item['metadata'])
+    return reference, golden
+
+
+def sync_collection(collection, items: dict, batch_size: int = INGEST_BATCH_SIZE) -> dict:
+    """
+    Bring a collection in line with items: upsert new or changed chunks
+    (by content hash) in batches and delete ids that are no longer present.
+    Unchanged chunks are not re-embedded.
+    """
+    existing = collection.get(include=["metadatas"])
+    stored_hashes = {
+        id_: (meta or {}).get("content_hash")
+        for id_, meta in zip(existing["ids"], existing["metadatas"])
+    }
+
+    changed = []
+    for id_, (document, metadata) in items.items():
+        digest = content_hash(document, metadata)
+        if stored_hashes.get(id_) != digest:
+            changed.append((id_, document, {**metadata, "content_hash": digest}))
+
+    removed = [id_ for id_ in stored_hashes if id_ not in items]
+
+    for start in range(0, len(changed), batch_size):
+        batch = changed[start:start + batch_size]
+        collection.upsert(
+            ids=[id_ for id_, _, _ in batch],
+            documents=[document for _, document, _ in batch],
+            metadatas=[metadata for _, _, metadata in batch]
+        )
+    for start in range(0, len(removed), batch_size):
+        collection.delete(ids=removed[start:start + batch_size])
+
+    return {
+        "upserted": len(changed),
+        "deleted": len(removed),
+        "unchanged": len(items) - len(changed),
+        "hashes": sorted(content_hash(d, m) for d, m in items.values())
+    }
+
+
+def stored_hashes(collection) -> dict:
+    """Content hashes of the chunks already in a collection (for stamping an existing DB)"""
+    existing = collection.get(include=["documents", "metadatas"])
+    hashes = []
+    for document, metadata in zip(existing["documents"], existing["metadatas"]):
+        metadata = {k: v for k, v in (metadata or {}).items() if k != "content_hash"}
+        hashes.append(content_hash(document, metadata))
+    return {"hashes": sorted(hashes)}
+
+
+def write_version_stamp(path: str, stats: dict, collection_ids: dict) -> str:
+    """
+    Write kb_version.json. The version is derived from every chunk's hash,
+    so it only changes when the knowledge base content does; the collection
+    ids change on every --rebuild, so running workers re-open their handles
+    even when the rebuilt content is identical.
+    """
+    digest = hashlib.sha1()
+    for name in sorted(stats):
+        digest.update(name.encode("utf-8"))
+        for h in stats[name]["hashes"]:
+            digest.update(h.encode("ascii"))
+    version = digest.hexdigest()[:16]
+
+    stamp = {
+        "version": version,
+        "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "collections": {name: len(s["hashes"]) for name, s in stats.items()},
+        "collection_ids": collection_ids
+    }
+    tmp_path = os.path.join(path, VERSION_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(stamp, f, indent=2)
+    os.replace(tmp_path, os.path.join(path, VERSION_FILE))
+    return version
+
+
+def setup(rebuild: bool = False):
     if not os.path.exists(json_path):
         print(f"❌ Error: {json_path} not found. Run preprocess_pdf.py first.")
         return
@@ -31,36 +122,59 @@ def setup():
     with open(json_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    print(f"📦 Loading {len(data)} items into ChromaDB...")
+    # Initialize Client
+    db_client = chromadb.PersistentClient(path=db_path)
 
-    # Batch lists for efficiency
-    ref_ids, ref_docs, ref_metas = [], [], []
-    gold_ids, gold_docs, gold_metas = [], [], []
+    if rebuild:
+        # Full rebuild on request only (e.g. after an embedding model change)
+        for name in ("golden_collection", "reference_collection"):
+            try:
+                db_client.delete_collection(name)
+                print(f"🗑️ Dropped {name}")
+            except Exception:
+                pass
 
-    for item in data:
-        # Reference Data
-        ref_ids.append(item['id'])
-        ref_docs.append(item['content'])
-        ref_metas.append(item['metadata'])
+    # 2. Setup GATE 1: The Golden Gate (Precision)
+    golden_coll = db_client.get_or_create_collection(name="golden_collection")
 
-        # Golden Data
-        if item['metadata'].get('is_golden'):
-            golden_rule = item['metadata'].get('golden_rule_content')
-            if golden_rule:
-                gold_ids.append(f"{item['id']}_GOLD")
-                gold_docs.append(golden_rule)
-                gold_metas.append(item['metadata'])
+    # 3. Setup GATE 2: The Reference Gate (Intelligence)
+    reference_coll = db_client.get_or_create_collection(name="reference_collection")
 
-    # Bulk Upsert
-    if ref_ids:
-        reference_coll.upsert(ids=ref_ids, documents=ref_docs, metadatas=ref_metas)
-    if gold_ids:
-        golden_coll.upsert(ids=gold_ids, documents=gold_docs, metadatas=gold_metas)
+    reference_items, golden_items = build_items(data)
+    print(f"📦 Syncing {len(data)} items into ChromaDB (batch size {INGEST_BATCH_SIZE})...")
 
+    started = time.perf_counter()
+    stats = {
+        "reference_collection": sync_collection(reference_coll, reference_items),
+        "golden_collection": sync_collection(golden_coll, golden_items)
+    }
+    version = write_version_stamp(db_path, stats, {
+        "reference_collection": str(reference_coll.id),
+        "golden_collection": str(golden_coll.id)
+    })
+
+    for name, s in stats.items():
+        print(f"🔁 {name}: {s['upserted']} upserted, {s['deleted']} deleted, {s['unchanged']} unchanged")
     print(f"✅ Golden Collection: {golden_coll.count()} rules")
     print(f"✅ Reference Collection: {reference_coll.count()} chunks")
+    print(f"🏷️ Knowledge base version: {version} ({time.perf_counter() - started:.2f}s)")
     print(f"📍 DB Location: {db_path}")
     print("Technical Execution: Tiered Collections are now READY!")
 
+def stamp():
+    """Write kb_version.json for the database as it is, without ingesting (--stamp)"""
+    db_client = chromadb.PersistentClient(path=db_path)
+    collections = {
+        name: db_client.get_collection(name)
+        for name in ("reference_collection", "golden_collection")
+    }
+    stats = {name: stored_hashes(collection) for name, collection in collections.items()}
+    version = write_version_stamp(db_path, stats, {name: str(c.id) for name, c in collections.items()})
+    print(f"🏷️ Knowledge base version: {version}")
+
+
 if __name__ == "__main__":
-    setup()
\ No newline at end of file
+    if "--stamp" in sys.argv:
+        stamp()
+    else:
+        setup(rebuild="--rebuild" in sys.argv)
@@ -0,0 +1,69 @@
+"""
+Single-Flight Request Coalescing
+Concurrent identical requests share one upstream call: the first caller starts
+it as a task, later callers with the same key await that same task. Keys are
+forgotten as soon as the call finishes, so this never serves stale results
+(the TTL caches handle reuse after completion).
+The shared task runs while anyone is still waiting for it; once its last
+caller gives up (timeout, disconnect) it is cancelled.
+Counters: singleflight.<name>.calls (upstream calls made),
+singleflight.<name>.saved (calls avoided by joining one in flight) and
+singleflight.<name>.abandoned (calls cancelled after every caller left).
+"""
+
+import json
+import asyncio
+import hashlib
+
+import metrics
+
+
+def payload_hash(payload) -> str:
+    """Stable hash of a JSON-like request payload"""
+    encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}  # key -> [asyncio.Task, number of callers waiting on it]
+
+    async def do(self, key, fn):
+        """
+        Await fn() once per key among concurrent callers. Each caller waits on
+        the shared task through a shield, so one caller timing out doesn't
+        cancel it for the others; the last one to leave cancels it.
+        """
+        flight = self._inflight.get(key)
+        if flight is None or flight[0].get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(fn())
+            flight = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda t: self._forget(key, t))
+            metrics.incr(f"singleflight.{self.name}.calls")
+        else:
+            metrics.incr(f"singleflight.{self.name}.saved")
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                # Nobody wants the result any more; don't let it hold an upstream slot
+                task.cancel()
+                self._forget(key, task)
+                metrics.incr(f"singleflight.{self.name}.abandoned")
+
+    def _forget(self, key, task):
+        flight = self._inflight.get(key)
+        if flight is not None and flight[0] is task:
+            del self._inflight[key]
+        # Retrieve the exception so an unawaited failure isn't logged as lost
+        if task.done() and not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
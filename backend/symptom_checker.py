@@ -3,26 +3,8 @@ Symptom Checker Service - Vector DB Powered
 Uses ChromaDB for semantic symptom matching and LLM for analysis
 """
 
-import os
-from groq import Groq
-import chromadb
 import json
-
-# Initialize Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-# Initialize ChromaDB
-current_dir = os.path.dirname(os.path.abspath(__file__))
-db_path = os.path.join(current_dir, "medical_db")
-db_client = chromadb.PersistentClient(path=db_path)
-
-# Get existing collection
-try:
-    guidelines_collection = db_client.get_collection(name="nhsrc_guidelines")
-    print("✅ [Symptom Checker] Connected to medical knowledge base")
-except Exception as e:
-    print(f"⚠️ [Symptom Checker] Warning: {e}")
-    guidelines_collection = None
+from resources import REFERENCE_COLLECTION, drop_collection, get_sync_groq, get_collection
 
 
 def analyze_symptoms(symptoms: list, duration: str = None, severity: int = None, body_part: str = None):
@@ -54,6 +36,7 @@ def analyze_symptoms(symptoms: list, duration: str = None, severity: int = None,
     
     # Query vector DB for relevant medical knowledge
     relevant_guidelines = []
+    guidelines_collection = get_collection()
     if guidelines_collection:
         try:
             results = guidelines_collection.query(
@@ -66,6 +49,9 @@ def analyze_symptoms(symptoms: list, duration: str = None, severity: int = None,
                 print(f"📚 [Symptom Checker] Found {len(relevant_guidelines)} relevant guidelines")
         except Exception as e:
             print(f"⚠️ [Symptom Checker] Vector search error: {e}")
+            if type(e).__name__ == "NotFoundError":
+                # Collection was recreated; the next request re-opens it
+                drop_collection(REFERENCE_COLLECTION)
     
     # Build context for LLM
     context = "\n\n".join(relevant_guidelines) if relevant_guidelines else "No specific guidelines found."
@@ -115,7 +101,7 @@ Relevant Medical Guidelines:
 Provide a comprehensive symptom analysis in JSON format."""
 
     try:
-        completion = client.chat.completions.create(
+        completion = get_sync_groq().chat.completions.create(
             model="llama-3.1-70b-versatile",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -0,0 +1,174 @@
+"""
+Symptom Lexicon & Segmenter
+Maps free-text symptom descriptions to canonical symptom IDs.
+A word-level trie is built from symptom_lexicon.json synonyms, the cluster
+catalog terms and the emergency rule phrases; segment() walks the text once,
+taking the longest phrase at each position. extract() also keeps the
+separator-delimited spans it can't map as free-text symptoms and drops
+negated ones ("no fever but cough" -> ["cough"]).
+"""
+
+import os
+import re
+import json
+import threading
+from typing import List, Iterable
+
+from keyword_matcher import normalize, rule_phrases
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+SYMPTOM_LEXICON_PATH = os.getenv("SYMPTOM_LEXICON_PATH", os.path.join(current_dir, "symptom_lexicon.json"))
+
+# Lexicon and cluster phrases outrank rule phrases starting at the same word,
+# so "chest pain with sweating" segments into chest_pain + sweating
+PRIORITY_LEXICON = 1
+PRIORITY_RULE = 0
+
+_SEPARATORS = re.compile(r"\s*(?:,|;|&|\+|\n|\.(?!\d)|\band\b|\balso\b|\bplus\b|\bwith\b|\bbut\b)\s*")
+
+# A negation cue drops the rest of its span, unless it is part of a phrase ("can't breathe")
+_NEGATIONS = frozenset([
+    "no", "not", "without", "never", "nor", "deny", "denies", "denied",
+    "don't", "dont", "doesn't", "didn't", "haven't", "hasn't"
+])
+# Unrecognized spans made only of these (or numbers) aren't kept as symptoms
+_FILLER = frozenset([
+    "i", "i'm", "im", "me", "my", "it", "a", "an", "the", "some", "have", "has", "had", "having", "am", "is",
+    "are", "was", "been", "feel", "feeling", "got", "also", "since", "for", "from", "of", "in", "to", "very",
+    "really", "bit", "little", "day", "days", "week", "weeks", "hour", "hours", "ago", "today", "yesterday"
+])
+
+_lock = threading.Lock()
+_synonyms = None   # normalized phrase -> canonical id
+_labels = None     # canonical id -> display phrase
+
+
+def _load():
+    global _synonyms, _labels
+    if _synonyms is None:
+        with _lock:
+            if _synonyms is None:
+                synonyms, labels = {}, {}
+                try:
+                    with open(SYMPTOM_LEXICON_PATH, "r", encoding="utf-8") as f:
+                        lexicon = json.load(f)
+                except Exception as e:
+                    print(f"⚠️ [Lexicon] Could not load {SYMPTOM_LEXICON_PATH}: {e}")
+                    lexicon = {}
+                for symptom_id, phrases in lexicon.items():
+                    labels[symptom_id] = normalize(phrases[0]) if phrases else symptom_id.replace("_", " ")
+                    for phrase in phrases:
+                        synonyms.setdefault(normalize(phrase), symptom_id)
+                _labels = labels
+                _synonyms = synonyms
+    return _synonyms, _labels
+
+
+def canonical_id(phrase: str) -> str:
+    """Canonical ID for a phrase: its lexicon entry, else the phrase slugified"""
+    synonyms, _ = _load()
+    phrase = normalize(phrase)
+    return synonyms.get(phrase) or phrase.replace(" ", "_")
+
+
+def label(symptom: str) -> str:
+    """Human-readable phrase for a canonical ID (free text passes through)"""
+    _, labels = _load()
+    return labels.get(symptom) or symptom.replace("_", " ")
+
+
+class SymptomSegmenter:
+    """Word-level trie of symptom phrases -> (canonical id, priority)"""
+
+    def __init__(self):
+        self._root = {}
+        self.phrase_count = 0
+
+    def add(self, phrase: str, symptom_id: str, priority: int = PRIORITY_LEXICON):
+        words = normalize(phrase).split()
+        if not words:
+            return
+        node = self._root
+        for word in words:
+            node = node.setdefault(word, {})
+        current = node.get(None)
+        if current is None or priority > current[1]:
+            node[None] = (symptom_id, priority)
+            self.phrase_count += current is None
+
+    def _matches(self, words: List[str]) -> List[tuple]:
+        """(start, end, id) of the phrases in words, in order"""
+        found = []
+        i = 0
+        while i < len(words):
+            node = self._root
+            best = None  # (priority, length, id)
+            j = i
+            while j < len(words):
+                node = node.get(words[j])
+                if node is None:
+                    break
+                j += 1
+                entry = node.get(None)
+                if entry is not None and (best is None or (entry[1], j - i) > best[:2]):
+                    best = (entry[1], j - i, entry[0])
+            if best is None:
+                i += 1
+                continue
+            found.append((i, i + best[1], best[2]))
+            i += best[1]
+        return found
+
+    def segment(self, text: str) -> List[str]:
+        """
+        Canonical IDs of the symptoms in text, in order of appearance, without
+        duplicates. At each word the highest-priority, then longest, phrase
+        starting there wins; words that start no phrase are skipped.
+        """
+        found = []
+        for _, _, symptom_id in self._matches(normalize(text).split()):
+            if symptom_id not in found:
+                found.append(symptom_id)
+        return found
+
+    def extract(self, text: str) -> List[str]:
+        """
+        Symptoms in text, in order of appearance, without duplicates: the
+        canonical IDs of recognized phrases, plus each separator-delimited span
+        with no recognized phrase as free text. Within a span, everything
+        after a negation cue (no, not, without, denies, ...) is dropped.
+        """
+        found = []
+        for span in _SEPARATORS.split(text):
+            words = normalize(span).split()
+            matches = self._matches(words)
+            cut = len(words)
+            for k, word in enumerate(words):
+                if word in _NEGATIONS and not any(start <= k < end for start, end, _ in matches):
+                    cut = k
+                    break
+            kept = [symptom_id for start, _, symptom_id in matches if start < cut]
+            if not kept:
+                free = words[:cut]
+                if any(word not in _FILLER and not word.isdigit() for word in free):
+                    kept = [" ".join(free)]
+            for symptom in kept:
+                if symptom not in found:
+                    found.append(symptom)
+        return found
+
+
+def build_segmenter(rules: Iterable[dict] = (), cluster_terms: Iterable[str] = ()) -> SymptomSegmenter:
+    """Compile lexicon synonyms, cluster catalog terms and rule phrases into one trie"""
+    synonyms, _ = _load()
+    segmenter = SymptomSegmenter()
+    for phrase, symptom_id in synonyms.items():
+        segmenter.add(phrase, symptom_id)
+    for term in cluster_terms:
+        segmenter.add(term, canonical_id(term))
+    for rule in rules:
+        for symptom in rule.get("symptoms", []):
+            for phrase in rule_phrases(symptom):
+                segmenter.add(phrase, canonical_id(phrase), PRIORITY_RULE)
+    return segmenter
+
@@ -0,0 +1,38 @@
+"""
+Symptom extraction checks (lexicon segmenter + free-text spans + negation)
+Usage: python test_symptom_extraction.py   (or collected by pytest)
+"""
+
+from triage_service import extract_symptoms_from_text
+
+CASES = [
+    ("fever and joint swelling", ["fever", "joint swelling"]),
+    ("fever and burning urination and back pain", ["fever", "burning urination", "back_pain"]),
+    ("no fever but cough", ["cough"]),
+    ("cough, no fever", ["cough"]),
+    ("I have a cough without fever", ["cough"]),
+    ("denies chest pain, has dizziness", ["dizziness"]),
+    ("I don't have fever and my knee is swollen", ["my knee is swollen"]),
+    ("pain in arm plus sweating", ["arm_pain", "sweating"]),
+    ("chest pain with sweating", ["chest_pain", "sweating"]),
+    ("can't breathe and chest pain", ["shortness_of_breath", "chest_pain"]),
+    ("no appetite and fever for 3 days", ["loss_of_appetite", "fever"]),
+    ("fever since 2 days", ["fever"]),
+    ("no fever", []),
+]
+
+
+def test_extract_symptoms():
+    for text, expected in CASES:
+        assert extract_symptoms_from_text(text) == expected, (text, extract_symptoms_from_text(text))
+
+
+if __name__ == "__main__":
+    failures = 0
+    for text, expected in CASES:
+        got = extract_symptoms_from_text(text)
+        ok = got == expected
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {text!r} -> {got}" + ("" if ok else f" (expected {expected})"))
+    print(f"{len(CASES) - failures}/{len(CASES)} passed")
+    raise SystemExit(1 if failures else 0)
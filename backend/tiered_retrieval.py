@@ -0,0 +1,92 @@
+"""
+Two-Gate Tiered Retrieval
+Gate 1 (golden_collection): small set of curated clinical rules. A hit within
+GOLDEN_MAX_DISTANCE is answered directly from the rule text.
+Gate 2 (reference_collection): full guideline chunks, queried only when the
+golden gate has no confident match; callers summarize these with the LLM.
+"""
+
+import os
+import time
+
+import metrics
+import retrieval_cache
+from resources import CHROMA_DB_PATH, GOLDEN_COLLECTION, REFERENCE_COLLECTION, get_collection_async
+
+# Squared-L2 distance on normalized MiniLM vectors (0.6 ~ cosine similarity 0.7)
+GOLDEN_MAX_DISTANCE = float(os.getenv("GOLDEN_MAX_DISTANCE", "0.6"))
+GOLDEN_N_RESULTS = int(os.getenv("GOLDEN_N_RESULTS", "3"))
+
+GATES = ("golden", "reference")
+
+
+async def _query_gate(gate: str, collection_name: str, query_text: str, n_results: int):
+    """Run one gate's (memoized) query, recording its latency"""
+    collection = await get_collection_async(collection_name, CHROMA_DB_PATH)
+    if collection is None:
+        return None
+
+    started = time.perf_counter()
+    try:
+        return await retrieval_cache.query(collection, CHROMA_DB_PATH, query_text, n_results)
+    finally:
+        metrics.observe(f"retrieval.{gate}.seconds", time.perf_counter() - started)
+
+
+def _first(results: dict, field: str) -> list:
+    values = (results or {}).get(field) or [[]]
+    return values[0] or []
+
+
+async def retrieve(query_text: str, n_results: int = 3) -> dict:
+    """
+    Tiered lookup. Returns {"gate", "documents", "metadatas", "distances"}
+    where gate is "golden", "reference" or None (nothing retrieved).
+    """
+    try:
+        golden = await _query_gate("golden", GOLDEN_COLLECTION, query_text, GOLDEN_N_RESULTS)
+    except Exception as e:
+        print(f"⚠️ [Tiered Retrieval] Golden gate error: {e}")
+        golden = None
+
+    confident = [
+        (doc, meta, dist)
+        for doc, meta, dist in zip(_first(golden, "documents"), _first(golden, "metadatas"), _first(golden, "distances"))
+        if dist is not None and dist <= GOLDEN_MAX_DISTANCE
+    ]
+    if confident:
+        metrics.incr("retrieval.golden.hits")
+        print(f"🥇 [Tiered Retrieval] Golden hit (distance {confident[0][2]:.3f})")
+        return {
+            "gate": "golden",
+            "documents": [doc for doc, _, _ in confident],
+            "metadatas": [meta for _, meta, _ in confident],
+            "distances": [dist for _, _, dist in confident]
+        }
+    metrics.incr("retrieval.golden.misses")
+
+    reference = await _query_gate("reference", REFERENCE_COLLECTION, query_text, n_results)
+    documents = _first(reference, "documents")
+    metrics.incr("retrieval.reference.hits" if documents else "retrieval.reference.misses")
+    return {
+        "gate": "reference" if documents else None,
+        "documents": documents,
+        "metadatas": _first(reference, "metadatas"),
+        "distances": _first(reference, "distances")
+    }
+
+
+def gate_stats() -> dict:
+    """Per-gate hit rate and mean latency for /api/metrics"""
+    snapshot = metrics.snapshot()
+    stats = {}
+    for gate in GATES:
+        hits = snapshot["counters"].get(f"retrieval.{gate}.hits", 0)
+        misses = snapshot["counters"].get(f"retrieval.{gate}.misses", 0)
+        latency = snapshot["summaries"].get(f"retrieval.{gate}.seconds", {})
+        stats[gate] = {
+            "queries": hits + misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "avg_seconds": latency.get("avg")
+        }
+    return stats
@@ -0,0 +1,137 @@
+"""
+Semantic Triage Cache
+Caches analyze_symptom verdicts in two levels:
+1. Exact match on normalized symptom text ("headache, fever" == "fever and headache")
+2. Embedding similarity above TRIAGE_CACHE_SIMILARITY, only against cached
+   non-emergency verdicts with exactly the same canonical symptom set
+   (embeddings rank "severe chest pain, can't breathe" close to "mild chest
+   pain, breathing fine", so similarity alone never serves a verdict)
+Both levels are keyed by the emergency rules version the verdict was made
+under, so a verdict finished after a rules reload is never served under
+the new rules.
+
+Cached results are stored before the critical-keyword safety override,
+so callers must re-apply the override on every hit.
+"""
+
+import os
+import re
+import copy
+import asyncio
+
+import metrics
+from cache import TTLCache
+from resources import embed, embedder_available
+
+TRIAGE_CACHE_SIZE = int(os.getenv("TRIAGE_CACHE_SIZE", "1000"))
+TRIAGE_CACHE_TTL = float(os.getenv("TRIAGE_CACHE_TTL", "3600"))
+TRIAGE_CACHE_SIMILARITY = float(os.getenv("TRIAGE_CACHE_SIMILARITY", "0.92"))
+
+_cache = TTLCache(maxsize=TRIAGE_CACHE_SIZE, ttl=TRIAGE_CACHE_TTL)
+
+# Semantic index: (cache version, {(rules version, symptom set): (keys, normalized embedding matrix)})
+_index = None
+
+
+_SEPARATORS = re.compile(r"\s*(?:,|;|&|\+|/|\band\b|\balso\b|\bplus\b|\bwith\b)\s*")
+_NON_WORD = re.compile(r"[^a-z0-9' ]+")
+
+
+def normalize_symptom_text(text: str) -> str:
+    """
+    Canonical cache key: lowercase phrases, punctuation stripped,
+    split on separators, de-duplicated and sorted.
+    """
+    text = text.lower()
+    phrases = []
+    for part in _SEPARATORS.split(text):
+        part = " ".join(_NON_WORD.sub(" ", part).split())
+        if part and part not in phrases:
+            phrases.append(part)
+    return "|".join(sorted(phrases))
+
+
+def _embed(text: str):
+    import numpy as np
+
+    vector = np.asarray(embed([text])[0], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _semantic_lookup(embedding, rules_version: str, symptoms: frozenset):
+    global _index
+    import numpy as np
+
+    if _index is None or _index[0] != _cache.version:
+        groups = {}
+        for k, v in _cache.items():
+            if v.get("embedding") is not None and v.get("symptoms") and not v["result"].get("is_emergency"):
+                groups.setdefault((k[0], v["symptoms"]), []).append((k, v["embedding"]))
+        _index = (_cache.version, {
+            group: ([k for k, _ in entries], np.stack([e for _, e in entries]))
+            for group, entries in groups.items()
+        })
+
+    group = _index[1].get((rules_version, symptoms))
+    if group is None:
+        return None, 0.0
+
+    keys, matrix = group
+    scores = matrix @ embedding
+    best = int(np.argmax(scores))
+    return keys[best], float(scores[best])
+
+
+async def get(text: str, rules_version: str, symptoms=()):
+    """
+    Look up a verdict made under `rules_version`. `symptoms` are the canonical
+    symptoms extracted from text; the semantic level only runs for a non-empty set.
+    Returns (result, embedding): result is a deep copy (or None on miss);
+    embedding can be passed back to put().
+    """
+    text_key = normalize_symptom_text(text)
+    key = (rules_version, text_key)
+
+    entry = _cache.get(key)
+    if entry is not None:
+        metrics.incr("triage.cache.exact_hits")
+        return copy.deepcopy(entry["result"]), entry["embedding"]
+
+    symptoms = frozenset(symptoms)
+    embedding = None
+    if symptoms and embedder_available():
+        try:
+            embedding = await asyncio.to_thread(_embed, text_key.replace("|", ", "))
+        except Exception as e:
+            # resources backs off before the next load attempt
+            print(f"⚠️ [Triage Cache] Semantic level skipped: {e}")
+
+    if embedding is not None:
+        match_key, score = _semantic_lookup(embedding, rules_version, symptoms)
+        if match_key is not None and score >= TRIAGE_CACHE_SIMILARITY:
+            entry = _cache.get(match_key)
+            if entry is not None:
+                print(f"♻️ [Triage Cache] Semantic hit ({score:.3f}): '{text_key}' ~ '{match_key[1]}'")
+                metrics.incr("triage.cache.semantic_hits")
+                return copy.deepcopy(entry["result"]), embedding
+
+    metrics.incr("triage.cache.misses")
+    return None, embedding
+
+
+def put(text: str, rules_version: str, result: dict, embedding=None, symptoms=()):
+    """
+    Store a complete verdict (before safety override) for this symptom text,
+    made under `rules_version`. Callers must not store fail-safe verdicts or
+    ones with dropped stages.
+    """
+    _cache.set((rules_version, normalize_symptom_text(text)), {
+        "result": copy.deepcopy(result),
+        "embedding": embedding,
+        "symptoms": frozenset(symptoms)
+    })
+
+
+def clear():
+    _cache.clear()
@@ -1,97 +1,145 @@
 import os
-import json
-from groq import Groq
-from dotenv import load_dotenv
+import asyncio
+import deadline
+import metrics
 from correlation_analyzer import analyze_symptom_correlation
+from llm_client import GROQ_API_KEY, chat_completion
+from llm_scheduler import PRIORITY_ENRICHMENT
+from model_router import cascade_json, route_blocked
+import triage_cache
+from rule_engine import get_engine
+import retrieval_cache
+from resources import CHROMA_DB_PATH
+import tiered_retrieval
 import re
-import chromadb
-
-# Load env from current directory with explicit path
-current_dir_for_env = os.path.dirname(os.path.abspath(__file__))
-env_path = os.path.join(current_dir_for_env, ".env")
-load_dotenv(env_path)
-
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    print("⚠️ [Triage] GROQ_API_KEY not found in environment")
-    client = None
-else:
-    client = Groq(api_key=GROQ_API_KEY)
-
-# Initialize ChromaDB for RAG
-current_dir = os.path.dirname(os.path.abspath(__file__))
-db_path = os.path.join(current_dir, "medical_db")
-db_client = chromadb.PersistentClient(path=db_path)
-
-try:
-    guidelines_collection = db_client.get_collection(name="nhsrc_guidelines")
-    print("✅ [Triage] Connected to medical knowledge base (RAG)")
-except Exception as e:
-    print(f"⚠️ [Triage] RAG Warning: {e}")
-    guidelines_collection = None
-
-# Load Rules Global
-EMERGENCY_RULES = []
+
+# Compiled rules (prompt block + matcher over CRITICAL_KEYWORDS and rule phrases),
+# hot-reloaded when emergency_rules.json changes. Loaded here so the first
+# triage request doesn't pay for it.
+rule_engine = get_engine()
+
+# Return a rules-only verdict without any network call when the matcher fires
+RULES_FAST_PATH = os.getenv("TRIAGE_RULES_FAST_PATH", "1") == "1"
+
 
 def load_triage_rules():
-    global EMERGENCY_RULES
+    return rule_engine.reload()
+
+
+def rules_only_verdict(matches: list) -> dict:
+    """
+    Emergency verdict built purely from keyword/rule matches
+    """
+    rule_matches = [m for m in matches if m["type"] == "rule"]
+    top = rule_matches[0] if rule_matches else None
+    matched = sorted({m["keyword"] for m in matches})
+    return {
+        "is_emergency": True,
+        "matched_condition": top["condition"] if top else "Detected Critical Symptom",
+        "action": top["action"] if top else "Immediate Medical Attention",
+        "reason": f"Matched emergency rule phrases: {', '.join(matched)}",
+        "category": top["category"] if top else None,
+        "matched_rules": [
+            {"category": m["category"], "condition": m["condition"]} for m in rule_matches
+        ],
+        "source": "rules"
+    }
+
+
+def apply_safety_override(result: dict, text: str, is_critical_regex: bool) -> dict:
+    """
+    Force an emergency verdict when a critical keyword matched but the LLM said otherwise
+    """
+    if is_critical_regex and not result.get("is_emergency"):
+        print(f"⚠️ [Triage] Safety Override: Regex found critical keyword in '{text}'")
+        result["is_emergency"] = True
+        result["matched_condition"] = "Detected Critical Symptom (Safety Override)"
+        result["action"] = "Immediate Medical Attention"
+        result["reason"] = f"detected keyword: '{text}' matched critical safety list."
+    return result
+
+
+# Per-stage time budgets in seconds. A stage that overruns is dropped
+# so it can never hold up the emergency verdict.
+# The verdict's 8B first pass has its own budget (overrunning escalates), and
+# the 70B call gets VERDICT_TIMEOUT from its own start.
+CORRELATION_TIMEOUT = float(os.getenv("TRIAGE_CORRELATION_TIMEOUT", "4"))
+SMALL_VERDICT_TIMEOUT = float(os.getenv("TRIAGE_SMALL_VERDICT_TIMEOUT", "3"))
+VERDICT_TIMEOUT = float(os.getenv("TRIAGE_VERDICT_TIMEOUT", "8"))
+RAG_TIMEOUT = float(os.getenv("TRIAGE_RAG_TIMEOUT", "5"))
+
+# Stage budgets are also cut to the request deadline, keeping back a reserve
+# for building the response. With less than TRIAGE_MIN_VERDICT_SECONDS left
+# the rules-only fail-safe is returned instead of starting the LLM stages.
+DEADLINE_RESERVE = float(os.getenv("TRIAGE_DEADLINE_RESERVE", "0.5"))
+MIN_VERDICT_SECONDS = float(os.getenv("TRIAGE_MIN_VERDICT_SECONDS", "2"))
+
+
+def stage_budget(cap: float) -> float:
+    """A stage's budget: its own cap, or less if the request deadline is nearer"""
+    left = deadline.remaining()
+    if left is None:
+        return cap
+    return max(0.0, min(cap, left - DEADLINE_RESERVE))
+
+
+def fail_safe_verdict(is_critical_regex: bool, reason: str, correlation_data=None) -> dict:
+    """
+    Verdict without the LLM: emergency if the keyword/rule matcher fired
+    """
+    if is_critical_regex:
+        return {
+            "is_emergency": True,
+            "matched_condition": "Detected Critical Symptom (System Fail-Safe)",
+            "action": "Immediate Medical Attention",
+            "reason": "Symptom matches critical emergency keyword list. (AI System Recovery Mode)",
+            "correlation_analysis": correlation_data
+        }
+
+    return {
+        "is_emergency": False,
+        "action": "System Error",
+        "reason": reason,
+        "correlation_analysis": correlation_data
+    }
+
+
+async def run_stage(name: str, coro, timeout: float, dropped: list = None):
+    """
+    Await an optional enrichment stage within its budget.
+    Returns None if the stage times out or fails (and appends name to `dropped`).
+    """
+    if coro is None:
+        return None
     try:
-        rule_path = os.path.join(os.path.dirname(__file__), "emergency_rules.json")
-        if os.path.exists(rule_path):
-            with open(rule_path, "r") as f:
-                EMERGENCY_RULES = json.load(f)
-            print(f"✅ [Triage] Loaded {len(EMERGENCY_RULES)} condition categories.")
-        else:
-            print("⚠️ [Triage] emergency_rules.json not found.")
+        result = await asyncio.wait_for(coro, timeout)
+        print(f"✅ [Triage] {name} complete")
+        return result
+    except asyncio.TimeoutError:
+        print(f"⏱️ [Triage] {name} exceeded {timeout}s budget, dropped")
     except Exception as e:
-        print(f"❌ [Triage] Error loading rules: {e}")
+        print(f"⚠️ [Triage] {name} failed: {e}")
+    if dropped is not None:
+        dropped.append(name)
+    return None
 
-# Initial Load
-load_triage_rules()
 
-def analyze_symptom(text: str):
+def _valid_verdict(result: dict) -> bool:
+    return isinstance(result.get("is_emergency"), bool) and bool(result.get("action"))
+
+
+async def get_triage_verdict(text: str, rules, rule_match: bool = False) -> dict:
     """
-    Analyzes text against the JSON rules using Llama-3.3.
-    Now includes multi-symptom correlation analysis.
-    Returns structured dict {is_emergency, action, reasons, correlation_data...}
+    Emergency classification against the compiled emergency rules.
+    8B first pass; escalates to Llama-3.3 70B on low confidence, an invalid
+    verdict, an 8B pass over SMALL_VERDICT_TIMEOUT, or a rule match (see model_router).
+    The returned verdict has no "confidence" field.
     """
-    if not EMERGENCY_RULES:
-        return {"error": "Rules not loaded", "is_emergency": False}
-    
-    if not GROQ_API_KEY:
-         return {"error": "GROQ_API_KEY missing", "is_emergency": False}
-
-    # Extract individual symptoms from text
-    symptoms = extract_symptoms_from_text(text)
-    
-    # Run correlation analysis if multiple symptoms
-    correlation_data = None
-    if len(symptoms) >= 2:
-        try:
-            correlation_data = analyze_symptom_correlation(symptoms)
-            print(f"✅ [Triage] Correlation analysis complete")
-        except Exception as e:
-            print(f"⚠️ [Triage] Correlation analysis failed: {e}")
-
-    # --- 1. REGEX SAFETY NET ---
-    # Manually check for high-risk keywords to ensure safety regardless of LLM response
-    critical_keywords = [
-        "chest pain", "heart attack", "can't breathe", "breathless", 
-        "stroke", "numbness", "unconscious", "head injury", "bleeding",
-        "suicide", "poison", "overdose", "vision loss", "seizure", 
-        "slurred speech", "paralysis", "severe pain", "crushing"
-    ]
-    
-    # SIMPLIFIED CHECK: Check if any keyword is simply present in the text
-    is_critical_regex = any(kw in text.lower() for kw in critical_keywords)
-    print(f"🔍 [Triage Warning] Input: '{text}', Match Found: {is_critical_regex}")
-    
-    # --- 2. LLM ANALYSIS ---
     system_prompt = f"""
     You are an expert Medical Triage AI. Your PRIMARY DIRECTIVE is to detect emergencies based on the provided EMERGENCY RULES.
     
     EMERGENCY RULES (STRICT ENFORCEMENT REQUIRED):
-    {json.dumps(EMERGENCY_RULES)}
+    {rules.prompt_block}
 
     INSTRUCTIONS:
     1. Compare user input against the EMERGENCY RULES.
@@ -105,88 +153,154 @@ def analyze_symptom(text: str):
         "matched_condition": "Name of condition or null",
         "action": "Recommended action",
         "reason": "Explain WHY it matches the rule",
-        "category": "Category Name or null"
+        "category": "Category Name or null",
+        "confidence": "number from 0 to 1: how certain you are of this verdict"
     }}
     """
 
-    try:
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
-            ],
-            temperature=0,
-            response_format={"type": "json_object"}
+    verdict, _ = await cascade_json(
+        "triage",
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ],
+        validate=_valid_verdict,
+        rule_match=rule_match,
+        small_timeout=stage_budget(SMALL_VERDICT_TIMEOUT),
+        large_timeout=VERDICT_TIMEOUT,
+        temperature=0
+    )
+    return verdict
+
+
+async def analyze_symptom(text: str):
+    """
+    Analyzes text against the JSON rules using Llama-3.3.
+    Now includes multi-symptom correlation analysis.
+    The correlation, verdict and RAG stages run concurrently, each within its own budget.
+    Returns structured dict {is_emergency, action, reasons, correlation_data...}
+    """
+    # One consistent snapshot for the whole request, even if a reload lands mid-way
+    rules = rule_engine.current()
+    if not rules.rules:
+        return {"error": "Rules not loaded", "is_emergency": False}
+
+    # --- 1. KEYWORD / RULE SAFETY NET ---
+    # Single pass over the text for critical keywords and rule symptom phrases
+    matches = rules.matcher.match(text)
+    is_critical_regex = bool(matches)
+    print(f"🔍 [Triage Warning] Input: '{text}', Match Found: {is_critical_regex}")
+
+    # Obvious emergencies get a rules-only verdict before any network call
+    if is_critical_regex and RULES_FAST_PATH:
+        return rules_only_verdict(matches)
+    
+    if not GROQ_API_KEY:
+         return {"error": "GROQ_API_KEY missing", "is_emergency": False}
+
+    # Canonical symptom IDs (plus unrecognized spans) from the lexicon segmenter
+    symptoms = extract_symptoms_from_text(text, rules)
+
+    # Cached verdicts are stored pre-override, so the override is re-applied per request.
+    # They are keyed by rules version: a reload never serves verdicts made under old rules.
+    cached, embedding = await triage_cache.get(text, rules.version, symptoms)
+    if cached is not None:
+        return apply_safety_override(cached, text, is_critical_regex)
+
+    # Groq is failing for every model triage could use: don't wait on it
+    if route_blocked("triage", is_critical_regex):
+        print(f"🔴 [Triage] Triage model circuits open, returning fail-safe verdict")
+        metrics.incr("triage.circuit_fail_safe")
+        return fail_safe_verdict(is_critical_regex, "AI triage temporarily unavailable (upstream failing)")
+
+    # Not enough request time left for an LLM verdict: answer from the rules now
+    verdict_budget = stage_budget(VERDICT_TIMEOUT)
+    if verdict_budget < MIN_VERDICT_SECONDS:
+        print(f"⏱️ [Triage] {verdict_budget:.1f}s left before the request deadline, returning fail-safe verdict")
+        metrics.incr("triage.deadline_fail_safe")
+        return fail_safe_verdict(
+            is_critical_regex, f"Request deadline too close for AI triage ({verdict_budget:.1f}s left)"
         )
-        
-        result = json.loads(completion.choices[0].message.content)
-        result["DEBUG_MODE"] = "ACTIVE_V2"
-        
-        # --- 3. SAFETY OVERRIDE ---
-        if is_critical_regex and not result.get("is_emergency"):
-            print(f"⚠️ [Triage] Safety Override: Regex found critical keyword in '{text}'")
-            result["is_emergency"] = True
-            result["matched_condition"] = "Detected Critical Symptom (Safety Override)"
-            result["action"] = "Immediate Medical Attention"
-            result["reason"] = f"detected keyword: '{text}' matched critical safety list."
-        
-        # Add correlation data to result
-        if correlation_data:
-            result["correlation_analysis"] = correlation_data
-        
-        # Add RAG-based detailed analysis (APPEND, DO NOT OVERWRITE)
-        rag_summary = generate_rag_summary(text)
-        if rag_summary:
-            # Append RAG insights to the existing reason
-            current_reason = result.get("reason", "")
-            result["reason"] = f"{current_reason} | Clinical Context: {rag_summary}"
-        
-        return result
 
-    except Exception as e:
+    # --- 2. CONCURRENT STAGES ---
+    # Correlation analysis only runs if multiple symptoms were given
+    correlation_coro = analyze_symptom_correlation(symptoms) if len(symptoms) >= 2 else None
+
+    dropped = []
+    verdict, correlation_data, rag_summary = await asyncio.gather(
+        # Bounded per model inside the cascade, and by the request deadline
+        get_triage_verdict(text, rules, is_critical_regex),
+        run_stage("Correlation analysis", correlation_coro, stage_budget(CORRELATION_TIMEOUT), dropped),
+        run_stage("RAG summary", generate_rag_summary(text), stage_budget(RAG_TIMEOUT), dropped),
+        return_exceptions=True
+    )
+
+    if isinstance(verdict, BaseException):
+        e = verdict
+        if isinstance(e, asyncio.TimeoutError) and not isinstance(e, deadline.DeadlineExceeded):
+            e = TimeoutError(f"Triage verdict exceeded its {VERDICT_TIMEOUT:.1f}s budget")
         print(f"Triage LLM Error: {e}")
         
         # FAIL-SAFE: Still apply regex check even if LLM fails
-        if is_critical_regex:
-            return {
-                "is_emergency": True,
-                "matched_condition": "Detected Critical Symptom (System Fail-Safe)",
-                "action": "Immediate Medical Attention",
-                "reason": "Symptom matches critical emergency keyword list. (AI System Recovery Mode)",
-                "correlation_analysis": correlation_data
-            }
-            
-        return {
-            "is_emergency": False,
-            "action": "System Error",
-            "reason": str(e),
-            "correlation_analysis": correlation_data
-        }
+        return fail_safe_verdict(is_critical_regex, str(e), correlation_data)
 
+    # --- 3. MERGE ---
+    result = verdict
+    result["DEBUG_MODE"] = "ACTIVE_V2"
+    
+    # Add correlation data to result
+    if correlation_data:
+        result["correlation_analysis"] = correlation_data
+    
+    # Add RAG-based detailed analysis (APPEND, DO NOT OVERWRITE)
+    if rag_summary:
+        # Append RAG insights to the existing reason
+        current_reason = result.get("reason", "")
+        result["reason"] = f"{current_reason} | Clinical Context: {rag_summary}"
 
-def generate_rag_summary(symptom_text: str) -> str:
+    # Only complete verdicts are cached; a degraded one would be served for the full TTL
+    if dropped or not _valid_verdict(result):
+        print(f"🚫 [Triage] Verdict not cached (dropped: {', '.join(dropped) or 'invalid verdict'})")
+        metrics.incr("triage.cache.skipped_degraded")
+    else:
+        triage_cache.put(text, rules.version, result, embedding, symptoms)
+    
+    # Safety override
+    return apply_safety_override(result, text, is_critical_regex)
+
+
+RAG_N_RESULTS = 3
+
+
+async def generate_rag_summary(symptom_text: str) -> str:
     """
-    Generate detailed symptom analysis using RAG (ChromaDB + LLM)
+    Generate detailed symptom analysis using tiered RAG (ChromaDB + LLM).
+    A confident golden-rule match is returned directly without an LLM call.
+    Memoized per knowledge-base version. Returns None when nothing relevant is
+    retrieved; retrieval and LLM errors propagate.
     """
-    if not guidelines_collection:
+    return await retrieval_cache.summary(
+        CHROMA_DB_PATH, symptom_text, RAG_N_RESULTS,
+        lambda: _generate_rag_summary(symptom_text)
+    )
+
+
+async def _generate_rag_summary(symptom_text: str) -> str:
+    # Golden rules first, reference guidelines only on a golden miss
+    retrieved = await tiered_retrieval.retrieve(symptom_text, RAG_N_RESULTS)
+
+    if not retrieved["documents"]:
         return None
+
+    if retrieved["gate"] == "golden":
+        print(f"✅ [Triage] RAG summary answered from golden rules")
+        return " ".join(retrieved["documents"])
+
+    # Combine relevant medical guidelines
+    context = "\n\n".join(retrieved["documents"])
     
-    try:
-        # Query medical knowledge base
-        results = guidelines_collection.query(
-            query_texts=[symptom_text],
-            n_results=3
-        )
-        
-        if not results or not results['documents']:
-            return None
-        
-        # Combine relevant medical guidelines
-        context = "\n\n".join(results['documents'][0])
-        
-        # Generate summary using LLM with RAG context
-        rag_prompt = f"""Based on these medical guidelines:
+    # Generate summary using LLM with RAG context
+    rag_prompt = f"""Based on these medical guidelines:
 
 {context}
 
@@ -199,42 +313,27 @@ Provide a brief, helpful summary (2-3 sentences) that:
 
 Be concise, clear, and helpful."""
 
-        completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": "You are a helpful medical assistant. Provide clear, concise symptom analysis."},
-                {"role": "user", "content": rag_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=200
-        )
-        
-        summary = completion.choices[0].message.content.strip()
-        print(f"✅ [Triage] RAG summary generated")
-        return summary
-        
-    except Exception as e:
-        print(f"⚠️ [Triage] RAG summary error: {e}")
-        return None
+    completion = await chat_completion(
+        priority=PRIORITY_ENRICHMENT,
+        model="llama-3.3-70b-versatile",
+        messages=[
+            {"role": "system", "content": "You are a helpful medical assistant. Provide clear, concise symptom analysis."},
+            {"role": "user", "content": rag_prompt}
+        ],
+        temperature=0.3,
+        max_tokens=200
+    )
+    
+    summary = completion.choices[0].message.content.strip()
+    print(f"✅ [Triage] RAG summary generated")
+    return summary
 
 
-def extract_symptoms_from_text(text: str) -> list:
+def extract_symptoms_from_text(text: str, rules=None) -> list:
     """
-    Extract individual symptoms from user input text
-    Simple extraction - splits on common separators
+    Extract individual symptoms from user input text as canonical symptom IDs
+    (e.g. "pain in arm plus sweating" -> ["arm_pain", "sweating"]).
+    Spans with no known symptom are kept as free text, and negated ones dropped.
     """
-    # Common separators
-    separators = [',', 'and', '&', ';', 'also', 'plus']
-    
-    # Replace separators with |
-    for sep in separators:
-        text = text.replace(f' {sep} ', '|')
-    
-    # Split and clean
-    symptoms = [s.strip() for s in text.split('|') if s.strip()]
-    
-    # If no separators found, treat whole text as one symptom
-    if len(symptoms) == 0:
-        symptoms = [text.strip()]
-    
-    return symptoms
+    segmenter = (rules or rule_engine.current()).segmenter
+    return segmenter.extract(text)
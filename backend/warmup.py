@@ -0,0 +1,74 @@
+"""
+Background Warm-Up & Readiness
+Heavy subsystems (Firebase, OCR stack, Chroma) are loaded on first use or by
+a background warm-up started after the server is accepting connections.
+Each subsystem's state is tracked so /api/ready can report what is warm.
+"""
+
+import os
+import time
+import asyncio
+import threading
+
+# Set WARMUP_ON_STARTUP=0 to rely purely on first-use loading
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+_lock = threading.Lock()
+_state = {}      # name -> {"status", "seconds", "error"}
+_loaders = {}    # name -> (callable, required)
+
+
+def register(name: str, loader, required: bool = True):
+    """
+    Register a subsystem loader. Required subsystems gate readiness;
+    optional ones are reported but don't block it.
+    """
+    _loaders[name] = (loader, required)
+    _state.setdefault(name, {"status": "cold", "seconds": None, "error": None})
+
+
+def ensure(name: str):
+    """Load a subsystem now (idempotent). Safe to call from any thread."""
+    loader, _ = _loaders[name]
+    with _lock:
+        if _state[name]["status"] == "warm":
+            return
+        _state[name]["status"] = "warming"
+
+    started = time.perf_counter()
+    try:
+        loader()
+        status, error = "warm", None
+    except Exception as e:
+        status, error = "failed", str(e)
+        print(f"⚠️ [Warm-up] {name} failed: {e}")
+    elapsed = round(time.perf_counter() - started, 3)
+
+    with _lock:
+        _state[name] = {"status": status, "seconds": elapsed, "error": error}
+    if status == "warm":
+        print(f"🔥 [Warm-up] {name} ready in {elapsed}s")
+
+
+def warm_all():
+    """Load every registered subsystem in registration order"""
+    started = time.perf_counter()
+    for name in list(_loaders):
+        ensure(name)
+    print(f"🔥 [Warm-up] All subsystems processed in {time.perf_counter() - started:.2f}s")
+
+
+def start_background_warmup():
+    """Kick off warm_all in a worker thread without blocking startup"""
+    if WARMUP_ON_STARTUP:
+        asyncio.get_running_loop().run_in_executor(None, warm_all)
+
+
+def readiness() -> dict:
+    with _lock:
+        subsystems = {name: dict(state) for name, state in _state.items()}
+    ready = all(
+        subsystems[name]["status"] == "warm"
+        for name, (_, required) in _loaders.items() if required
+    )
+    return {"ready": ready, "subsystems": subsystems}
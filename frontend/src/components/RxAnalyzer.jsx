@@ -1,6 +1,9 @@
 import React, { useState } from 'react';
 import { API_BASE } from '../config';
 
+const POLL_INTERVAL_MS = 1000;
+const MAX_POLL_MS = 180000;
+
 export default function RxAnalyzer({ onBack, currentUser, selectedProfile }) {
     const [selectedFile, setSelectedFile] = useState(null);
     const [preview, setPreview] = useState(null);
@@ -49,12 +52,32 @@ export default function RxAnalyzer({ onBack, currentUser, selectedProfile }) {
         formData.append('image', selectedFile);
 
         try {
-            const response = await fetch(`${API_BASE}/analyze_prescription`, {
+            // Submit a job, then poll it instead of holding the upload open during OCR
+            const response = await fetch(`${API_BASE}/analyze_prescription/jobs`, {
                 method: 'POST',
                 body: formData
             });
+            if (!response.ok) {
+                throw new Error(`Job submission failed (${response.status})`);
+            }
+            const { job_id } = await response.json();
 
-            const data = await response.json();
+            // Give up a little after the server-side job budget (PRESCRIPTION_JOB_TIMEOUT)
+            const pollUntil = Date.now() + MAX_POLL_MS;
+            let job;
+            do {
+                if (Date.now() > pollUntil) {
+                    throw new Error('Prescription analysis timed out');
+                }
+                await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+                const poll = await fetch(`${API_BASE}/analyze_prescription/jobs/${job_id}`);
+                if (!poll.ok) {
+                    throw new Error(`Job poll failed (${poll.status})`);
+                }
+                job = await poll.json();
+            } while (job.status === 'queued' || job.status === 'running');
+
+            const data = job.status === 'done' ? job.result : { success: false, error: job.error || job.detail };
 
             if (data.success) {
                 setResult(data);